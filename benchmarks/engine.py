@@ -0,0 +1,382 @@
+# Benchmarks of the engine hot paths on the shipped maps, run headlessly.
+# Run from the project root with: python -m benchmarks.engine
+#   --save       stores the results as the new baseline
+#   --compare    compares with the baseline and exits with 1 on a regression
+import argparse
+import math
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.harness import (
+    REFERENCE,
+    Benchmark,
+    compare,
+    load_baseline,
+    reference_loop,
+    relative_speed,
+    save_baseline,
+)
+from game import DATA_PATH, Game
+from scripts.clouds import Clouds
+from scripts.entities import PhysicsEntity, Player
+from scripts.inputs import INPUT_DASH, INPUT_JUMP, INPUT_LEFT, INPUT_RIGHT
+from scripts.mapfile import MAP_EXTENSION, PAGED_EXTENSION
+from scripts.tilemap import TileMap
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+ENTITY_COUNTS = (1, 10, 100)
+PARTICLE_COUNTS = (64, 256, 1024)
+SPARK_COUNTS = (64, 256, 512)
+# Simulation steps per burst and per full frame benchmark
+BURST_FRAMES = 30
+GAME_FRAMES = 60
+
+
+def map_ids():
+    return sorted(int(path.stem) for path in (DATA_PATH / "maps").glob("*.json"))
+
+
+def map_path(map_id):
+    return DATA_PATH / "maps" / f"{map_id}.json"
+
+
+def reload(tile_map, map_id):
+    # Loads the map like Game.load_level does, without the spawner tiles
+    tile_map.load(map_path(map_id))
+    tile_map.extract([("spawners", 0), ("spawners", 1)])
+
+
+def load_map(game, map_id):
+    tile_map = TileMap(game, tile_size=16)
+    reload(tile_map, map_id)
+    return tile_map
+
+
+def camera_offsets(tile_map, size):
+    # Camera positions covering the whole map, half a screen apart
+    xs = [x for x, y, type_id, variant in tile_map.grid.cells()]
+    ys = [y for x, y, type_id, variant in tile_map.grid.cells()]
+    offsets = []
+    for y in range(
+        min(ys) * tile_map.tile_size - size[1],
+        max(ys) * tile_map.tile_size,
+        size[1] // 2,
+    ):
+        for x in range(
+            min(xs) * tile_map.tile_size - size[0],
+            max(xs) * tile_map.tile_size,
+            size[0] // 2,
+        ):
+            offsets.append((x, y))
+    return offsets
+
+
+def probe_points(tile_map):
+    # Points in and around every tile, where entities and projectiles end up
+    points = []
+    for x, y, type_id, variant in tile_map.grid.cells():
+        for dx, dy in ((0.5, 0.5), (0.5, -0.5), (-0.5, 0.5), (1.5, 0.5)):
+            points.append(
+                ((x + dx) * tile_map.tile_size, (y + dy) * tile_map.tile_size)
+            )
+    return points
+
+
+def map_contents(tile_map):
+    grid = sorted(
+        (x, y, tile_map.tile_types[type_id], variant)
+        for x, y, type_id, variant in tile_map.grid.cells()
+    )
+    return tile_map.tile_size, grid, tile_map.off_grid_tiles
+
+
+def save_benchmarks(game, map_id):
+    # Saving the JSON map in the binary formats. Every format is first checked to
+    # load back into the same map, so a broken save fails here.
+    benchmarks = []
+    tile_map = TileMap(game, tile_size=16)
+    tile_map.load(map_path(map_id))
+    for extension in (MAP_EXTENSION, PAGED_EXTENSION):
+        path = Path(tempfile.gettempdir()) / f"benchmark_map_{map_id}{extension}"
+        tile_map.save(path)
+        saved = TileMap(game, tile_size=16)
+        saved.load(path, stream=False)
+        if map_contents(saved) != map_contents(tile_map):
+            raise ValueError(f"Map {map_id} changed when saved as {extension}")
+        benchmarks.append(
+            Benchmark(
+                f"tilemap.save[{map_id}{extension}]",
+                lambda path=path: tile_map.save(path),
+            )
+        )
+    return benchmarks
+
+
+def tile_map_benchmarks(game, map_id):
+    benchmarks = []
+    tile_map = load_map(game, map_id)
+    offsets = camera_offsets(tile_map, game.display.get_size())
+    points = probe_points(tile_map)
+
+    benchmarks.append(
+        Benchmark(f"tilemap.load[{map_id}]", lambda: tile_map.load(map_path(map_id)))
+    )
+    benchmarks.append(
+        Benchmark(
+            f"tilemap.auto_tile[{map_id}]",
+            tile_map.auto_tile,
+            setup=lambda: reload(tile_map, map_id),
+        )
+    )
+
+    def render():
+        for offset in offsets:
+            tile_map.render(game.display, offset=offset)
+
+    def render_cold():
+        for offset in offsets:
+            tile_map.chunk_surfaces = {}
+            tile_map.render(game.display, offset=offset)
+
+    def warm_up():
+        reload(tile_map, map_id)
+        render()
+
+    benchmarks.append(
+        Benchmark(f"tilemap.render[{map_id}]", render, setup=warm_up, ops=len(offsets))
+    )
+    benchmarks.append(
+        Benchmark(
+            f"tilemap.render_cold[{map_id}]",
+            render_cold,
+            setup=lambda: reload(tile_map, map_id),
+            ops=len(offsets),
+        )
+    )
+
+    def physics_rects_around():
+        for point in points:
+            tile_map.physics_rects_around(point)
+
+    def solid_check():
+        for point in points:
+            tile_map.solid_check(point)
+
+    benchmarks.append(
+        Benchmark(
+            f"tilemap.physics_rects_around[{map_id}]",
+            physics_rects_around,
+            setup=lambda: reload(tile_map, map_id),
+            ops=len(points),
+        )
+    )
+    benchmarks.append(
+        Benchmark(
+            f"tilemap.solid_check[{map_id}]",
+            solid_check,
+            setup=lambda: reload(tile_map, map_id),
+            ops=len(points),
+        )
+    )
+    return benchmarks
+
+
+def entity_benchmarks(game, count):
+    # 'count' entities dropped above the solid tiles of the first map, walking
+    # back and forth so they keep running into walls and floors
+    tile_map = load_map(game, map_ids()[0])
+    starts = sorted(tile_map.physics_rects)
+    entities = []
+
+    def setup():
+        entities.clear()
+        for i in range(count):
+            x, y = starts[i * len(starts) // count]
+            entities.append(
+                PhysicsEntity(
+                    game,
+                    "player",
+                    (x * tile_map.tile_size, (y - 2) * tile_map.tile_size),
+                    (8, 15),
+                )
+            )
+
+    def update():
+        for i, entity in enumerate(entities):
+            entity.update(tile_map, (1 if i % 2 else -1, 0))
+
+    return [Benchmark(f"entities.update[n={count}]", update, setup=setup)]
+
+
+def effect_benchmarks(game):
+    benchmarks = []
+    rng = random.Random(0)
+
+    def particle_burst(count):
+        def burst():
+            for i in range(count):
+                angle = rng.random() * math.pi * 2
+                game.particles.spawn(
+                    "particle",
+                    (160, 120),
+                    velocity=[math.cos(angle) * 2, math.sin(angle) * 2],
+                    frame=rng.randint(0, 7),
+                )
+            for _ in range(BURST_FRAMES):
+                game.particles.update()
+                game.particles.render(game.display)
+
+        return burst
+
+    def spark_burst(count):
+        def burst():
+            for i in range(count):
+                game.sparks.spawn(
+                    (160, 120), rng.random() * math.pi * 2, 2 + rng.random()
+                )
+            for _ in range(BURST_FRAMES):
+                game.sparks.update()
+                game.sparks.render(game.display)
+
+        return burst
+
+    for count in PARTICLE_COUNTS:
+        benchmarks.append(
+            Benchmark(
+                f"particles.burst[n={count}]",
+                particle_burst(count),
+                setup=game.particles.clear,
+                ops=BURST_FRAMES,
+            )
+        )
+    for count in SPARK_COUNTS:
+        benchmarks.append(
+            Benchmark(
+                f"sparks.burst[n={count}]",
+                spark_burst(count),
+                setup=game.sparks.clear,
+                ops=BURST_FRAMES,
+            )
+        )
+    return benchmarks
+
+
+def game_benchmarks(game, level):
+    # One frame of Game.run (simulation step, events and rendering) with scripted
+    # inputs, every sample restarts the level from the same state: the game state
+    # that carries over between levels is made again like in Game.__init__
+    script = random.Random(level)
+    inputs = [
+        script.choice((INPUT_RIGHT, INPUT_LEFT))
+        | (INPUT_JUMP if script.random() < 0.05 else 0)
+        | (INPUT_DASH if script.random() < 0.02 else 0)
+        for _ in range(GAME_FRAMES)
+    ]
+
+    def setup():
+        game.rng.seed(level)
+        game.clouds = Clouds(game.assets["clouds"], count=16, rng=game.rng)
+        game.player = Player(game, (50, 50), (8, 15))
+        game.movement = [False, False]
+        game.pressed = 0
+        game.frame = 0
+        game.screen_shake = 0
+        game.screen_shake_offset = (0, 0)
+        game.level = level
+        game.load_level(level)
+
+    def frames():
+        for frame_input in inputs:
+            game.update(frame_input)
+            game.handle_events()
+            game.render()
+
+    return [Benchmark(f"game.frame[{level}]", frames, setup=setup, ops=GAME_FRAMES)]
+
+
+def all_benchmarks(game):
+    benchmarks = [Benchmark(REFERENCE, reference_loop)]
+    for map_id in map_ids():
+        benchmarks.extend(tile_map_benchmarks(game, map_id))
+        benchmarks.extend(save_benchmarks(game, map_id))
+    for count in ENTITY_COUNTS:
+        benchmarks.extend(entity_benchmarks(game, count))
+    benchmarks.extend(effect_benchmarks(game))
+    for level in map_ids():
+        benchmarks.extend(game_benchmarks(game, level))
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engine hot paths.")
+    parser.add_argument(
+        "-k",
+        "--filter",
+        default="",
+        help="only run benchmarks whose name contains this",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="samples per benchmark")
+    parser.add_argument(
+        "--min-time", type=float, default=0.1, help="minimum seconds per sample"
+    )
+    parser.add_argument(
+        "--baseline", default=BASELINE_PATH, help="baseline file to save or compare"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the baseline"
+    )
+    parser.add_argument(
+        "--compare", action="store_true", help="fail on regressions from the baseline"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.15,
+        help="relative change counted as a regression (default 0.15)",
+    )
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline) if args.compare else {}
+    game = Game(headless=True, seed=0)
+
+    results = {}
+    header = f"{'benchmark':<36}{'ops/s':>12}{'us/op':>10}{'peak KiB':>10}"
+    print(header + ("  vs baseline" if baseline else ""))
+    for benchmark in all_benchmarks(game):
+        # The reference always runs, the comparisons are scaled by it
+        if args.filter not in benchmark.name and benchmark.name != REFERENCE:
+            continue
+        result = results[benchmark.name] = benchmark.measure(
+            repeat=args.repeat, min_time=args.min_time
+        )
+        line = (
+            f"{benchmark.name:<36}{result['ops_per_sec']:>12.1f}"
+            f"{result['us_per_op']:>10.2f}{result['peak_kib']:>10.1f}"
+        )
+        if benchmark.name in baseline:
+            line += f"  {relative_speed(results, baseline, benchmark.name) - 1:+.1%}"
+        print(line)
+
+    if args.save:
+        if args.filter:
+            # Only the benchmarks that ran are replaced
+            try:
+                results = dict(load_baseline(args.baseline), **results)
+            except FileNotFoundError:
+                pass
+        save_baseline(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}")
+
+    if args.compare:
+        regressions = compare(results, baseline, threshold=args.threshold)
+        for name, message in regressions:
+            print(f"REGRESSION {name}: {message}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Timing and memory measurement for the benchmarks, plus the baseline file they
+# are compared against
+import json
+import time
+import tracemalloc
+
+# Name of the benchmark that measures the machine itself rather than the engine
+REFERENCE = "machine.reference"
+
+
+class Benchmark:
+    def __init__(self, name, func, setup=None, ops=1):
+        # 'func' runs one batch of 'ops' operations, 'setup' (if any) runs before
+        # every sample so each one starts from the same state
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.ops = ops
+
+    def measure(self, repeat=5, min_time=0.1):
+        # The batch is repeated until a sample takes at least 'min_time' seconds,
+        # the fastest of 'repeat' samples is kept as the one with the least noise
+        # from the rest of the machine (like timeit does)
+        if self.setup is not None:
+            self.setup()
+        calls = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(calls):
+                self.func()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+            calls *= 2 if elapsed < min_time / 4 else 1 + int(min_time / elapsed)
+
+        samples = []
+        for _ in range(repeat):
+            if self.setup is not None:
+                self.setup()
+            start = time.perf_counter()
+            for _ in range(calls):
+                self.func()
+            samples.append((time.perf_counter() - start) / (calls * self.ops))
+        seconds = min(samples)
+
+        # Memory is traced in a separate pass since tracing slows everything down
+        if self.setup is not None:
+            self.setup()
+        tracemalloc.start()
+        self.func()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            "ops_per_sec": 1 / seconds,
+            "us_per_op": seconds * 1e6,
+            "peak_kib": peak / 1024,
+            "retained_kib": current / 1024,
+        }
+
+
+def reference_loop():
+    # Plain interpreter work with no engine code in it, comparisons are scaled by
+    # its speed so a baseline from a faster or busier machine still lines up
+    total = 0
+    for i in range(10000):
+        total += i * i % 7
+    return total
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baseline, threshold=0.15, memory_slack_kib=64):
+    # Returns the regressions as (name, message). A benchmark regresses when its
+    # throughput (relative to the reference loop) drops by more than 'threshold',
+    # or when its peak memory grows by more than 'threshold' and by more than
+    # 'memory_slack_kib'
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or name == REFERENCE:
+            continue
+        base = baseline[name]
+        speed = relative_speed(results, baseline, name) - 1
+        if speed < -threshold:
+            regressions.append((name, f"throughput {speed:+.1%}"))
+        memory = result["peak_kib"] - base["peak_kib"]
+        if memory > memory_slack_kib and result["peak_kib"] > base["peak_kib"] * (
+            1 + threshold
+        ):
+            regressions.append((name, f"peak memory {memory:+.0f} KiB"))
+    return regressions
+
+
+def relative_speed(results, baseline, name):
+    speed = results[name]["ops_per_sec"] / baseline[name]["ops_per_sec"]
+    if name != REFERENCE and REFERENCE in results and REFERENCE in baseline:
+        speed /= results[REFERENCE]["ops_per_sec"] / baseline[REFERENCE]["ops_per_sec"]
+    return speed
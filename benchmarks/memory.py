@@ -0,0 +1,66 @@
+# Per-instance memory of the slotted classes, compared with the same attributes
+# stored the way they used to be (an instance __dict__, and a dict for the collisions).
+# Run from the project root with: python -m benchmarks.memory
+import sys
+
+import pygame
+
+from scripts.clouds import Cloud
+from scripts.entities import Enemy, PhysicsEntity, Player
+from scripts.utils import Animation
+
+
+class DictInstance:
+    pass
+
+
+class StubGame:
+    def __init__(self):
+        frames = [pygame.Surface((8, 8)) for _ in range(4)]
+        self.assets = {
+            f"{e_type}/{action}": Animation(frames)
+            for e_type in ["entity", "enemy", "player"]
+            for action in ["idle", "run", "jump", "wall_slide"]
+        }
+
+
+def slot_names(cls):
+    names = []
+    for klass in cls.__mro__:
+        names.extend(getattr(klass, "__slots__", ()))
+    return names
+
+
+def slotted_size(obj):
+    return sys.getsizeof(obj)
+
+
+def dict_size(obj):
+    # The same object rebuilt as a regular instance with a __dict__
+    before = DictInstance()
+    for name in slot_names(type(obj)):
+        setattr(before, name, getattr(obj, name))
+    size = sys.getsizeof(before) + sys.getsizeof(before.__dict__)
+    if "collisions" in before.__dict__:
+        size += sys.getsizeof(
+            {"up": False, "down": False, "left": False, "right": False}
+        )
+    return size
+
+
+def main():
+    game = StubGame()
+    instances = {
+        "PhysicsEntity": PhysicsEntity(game, "entity", (0, 0), (8, 15)),
+        "Enemy": Enemy(game, (0, 0), (8, 15)),
+        "Player": Player(game, (0, 0), (8, 15)),
+        "Cloud": Cloud((0, 0), pygame.Surface((8, 8)), 0.05, 0.02),
+        "Animation": game.assets["player/idle"].copy(),
+    }
+    print(f"{'class':<16}{'before (B)':>12}{'after (B)':>12}")
+    for name, obj in instances.items():
+        print(f"{name:<16}{dict_size(obj):>12}{slotted_size(obj):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,10 @@ import sys
 
 import pygame
 
-from scripts.utils import load_images
+from scripts.assets import load_image_store
+from scripts.presenter import Presenter
 from scripts.tilemap import TileMap
 
-RENDER_SCALE = 2.0
-
 
 class Editor:
     def __init__(self):
@@ -16,21 +15,24 @@ class Editor:
 
         self.screen = pygame.display.set_mode((640, 480))
         self.display = pygame.Surface((320, 240))
+        self.presenter = Presenter(self.screen, self.display)
 
         self.clock = pygame.time.Clock()
 
+        images = load_image_store()
         self.assets = {
-            "decor": load_images("/tiles/decor"),
-            "grass": load_images("/tiles/grass"),
-            "large_decor": load_images("/tiles/large_decor"),
-            "stone": load_images("/tiles/stone"),
-            "spawners": load_images("/tiles/spawners"),
+            "decor": images.images("/tiles/decor"),
+            "grass": images.images("/tiles/grass"),
+            "large_decor": images.images("/tiles/large_decor"),
+            "stone": images.images("/tiles/stone"),
+            "spawners": images.images("/tiles/spawners"),
         }
         self.movement = [False, False, False, False]
 
         self.tile_map = TileMap(self, tile_size=16)
         try:
-            self.tile_map.load("map.json")
+            # The whole map, also when it's a paged one, since it's saved back
+            self.tile_map.load("map.json", stream=False)
         except FileNotFoundError:
             pass
         self.scroll = [0.0, 0.0]
@@ -43,6 +45,8 @@ class Editor:
         self.right_clicking = False
         self.shift_held = False
         self.on_grid = True
+        # Auto-tile the cells around every edit while painting, toggled with L
+        self.auto_tiling = True
 
     def run(self):
         while True:
@@ -60,8 +64,7 @@ class Editor:
             ].copy()
             current_tile_img.set_alpha(100)
 
-            mpos = pygame.mouse.get_pos()
-            mpos = (mpos[0] / RENDER_SCALE, mpos[1] / RENDER_SCALE)
+            mpos = self.presenter.to_source(pygame.mouse.get_pos())
             tile_pos = (
                 int((mpos[0] + render_scroll[0]) // self.tile_map.tile_size),
                 int((mpos[1] + render_scroll[1]) // self.tile_map.tile_size),
@@ -79,25 +82,22 @@ class Editor:
                 self.display.blit(current_tile_img, mpos)
 
             if self.clicking and self.on_grid:
-                self.tile_map.tile_map[str(tile_pos[0]) + ";" + str(tile_pos[1])] = {
-                    "type": self.tiles_list[self.tile_group],
-                    "variant": self.tile_variant,
-                    "pos": (tile_pos[0], tile_pos[1]),
-                }
+                tile_type = self.tiles_list[self.tile_group]
+                tile = self.tile_map.tile_at(tile_pos)
+                # Painting over the same type again would only undo its auto-tiling
+                if not (
+                    self.auto_tiling and tile is not None and tile["type"] == tile_type
+                ):
+                    self.tile_map.set_tile(tile_pos, tile_type, self.tile_variant)
+                    if self.auto_tiling:
+                        self.tile_map.auto_tile_around(tile_pos)
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ";" + str(tile_pos[1])
-                if tile_loc in self.tile_map.tile_map:
-                    del self.tile_map.tile_map[tile_loc]
-                for tile in self.tile_map.off_grid_tiles.copy():
-                    tile_img = self.assets[tile["type"]][tile["variant"]]
-                    tile_r = pygame.Rect(
-                        tile["pos"][0] - render_scroll[0],
-                        tile["pos"][1] - render_scroll[1],
-                        tile_img.get_width(),
-                        tile_img.get_height(),
-                    )
-                    if tile_r.collidepoint(mpos):
-                        self.tile_map.off_grid_tiles.remove(tile)
+                if self.tile_map.remove_tile(tile_pos) and self.auto_tiling:
+                    self.tile_map.auto_tile_around(tile_pos)
+                for tile in self.tile_map.off_grid_tiles_at(
+                    (mpos[0] + render_scroll[0], mpos[1] + render_scroll[1])
+                ):
+                    self.tile_map.remove_off_grid_tile(tile)
 
             self.display.blit(current_tile_img, (5, 5))
 
@@ -110,7 +110,7 @@ class Editor:
                     if event.button == 1:
                         self.clicking = True
                         if not self.on_grid:
-                            self.tile_map.off_grid_tiles.append(
+                            self.tile_map.add_off_grid_tile(
                                 {
                                     "type": self.tiles_list[self.tile_group],
                                     "variant": self.tile_variant,
@@ -172,6 +172,8 @@ class Editor:
                         self.on_grid = not self.on_grid
                     if event.key == pygame.K_t:
                         self.tile_map.auto_tile()
+                    if event.key == pygame.K_l:
+                        self.auto_tiling = not self.auto_tiling
                     if event.key == pygame.K_o:
                         self.tile_map.save("map.json")
                     if event.key == pygame.K_LSHIFT:
@@ -188,9 +190,7 @@ class Editor:
                     if event.key == pygame.K_LSHIFT:
                         self.shift_held = False
 
-            self.screen.blit(
-                pygame.transform.scale(self.display, self.screen.get_size()), (0, 0)
-            )
+            self.presenter.present(self.display)
             pygame.display.update()
             self.clock.tick(60)
 
@@ -1,71 +1,166 @@
+import argparse
+import json
 import math
 import os
 import random
 import sys
+import time
 from pathlib import Path
 
 import pygame
 
+from scripts.assets import load_image_store, load_sounds
+from scripts.broadphase import BroadPhase
 from scripts.clouds import Clouds
 from scripts.entities import Enemy, Player
-from scripts.particle import Particle
-from scripts.spark import Spark
-from scripts.tilemap import TileMap
-from scripts.utils import Animation, load_image, load_images
+from scripts.inputs import INPUT_DASH, INPUT_JUMP, INPUT_LEFT, INPUT_RIGHT
+from scripts.levels import LevelManager
+from scripts.outline import OutlineRenderer
+from scripts.particle import ParticleSystem
+from scripts.presenter import Presenter
+from scripts.profiler import Profiler
+from scripts.projectile import ProjectileSystem
+from scripts.renderer import LAYER_BACKGROUND, LAYER_PARTICLES, RenderQueue
+from scripts.replay import MAX_SEED, Replay
+from scripts.spark import SparkSystem
+from scripts.utils import Animation, SilentSound, TransformCache
 
 DATA_PATH = Path(__file__).parent / "data"
+# How the outlines around the sprites are drawn: "alpha", "mask" or "off"
+OUTLINE_MODE = "alpha"
+# Simulation steps per second, and the frame rate cap for rendering (0 for uncapped)
+SIMULATION_RATE = 60
+RENDER_RATE = 60
+# Longest stretch of real time simulated in one frame, so a long stall doesn't
+# turn into a burst of catch-up steps
+MAX_FRAME_TIME = 0.25
+# Window size, the 320x240 internal resolution is scaled up to it
+WINDOW_SIZE = (640, 480)
+
+
+def window_size_arg(value):
+    # "WxH" with two positive integers
+    try:
+        size = tuple(int(part) for part in value.lower().split("x"))
+    except ValueError:
+        size = ()
+    if len(size) != 2 or min(size) <= 0:
+        raise argparse.ArgumentTypeError("must be WxH, e.g. 640x480")
+    return size
+
+
+def seed_arg(value):
+    seed = int(value)
+    if not 0 <= seed <= MAX_SEED:
+        raise argparse.ArgumentTypeError(f"must be between 0 and {MAX_SEED}")
+    return seed
 
 
 class Game:
-    def __init__(self):
+    def __init__(
+        self,
+        headless=False,
+        level=0,
+        seed=None,
+        window_size=WINDOW_SIZE,
+        integer_scaling=False,
+    ):
+        # Headless mode runs without a window or an audio device (e.g. on CI servers),
+        # the game is then driven with step() instead of run()
+        self.headless = headless
+        if headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+        # All the randomness in the game comes from this generator, so a run can be
+        # reproduced from its seed and inputs. The seed has to fit in a replay file.
+        if seed is not None and not 0 <= seed <= MAX_SEED:
+            raise ValueError(f"Seed must be between 0 and {MAX_SEED}, not {seed}")
+        self.seed = seed if seed is not None else random.randrange(2**63)
+        self.rng = random.Random(self.seed)
+        # The Replay being recorded and the one being played back, if any
+        self.recording = None
+        self.record_path = None
+        self.replay = None
+
         pygame.init()
 
         pygame.display.set_caption("Ninja Game")
 
         # The 'screen' is the actual window, while 'display' is the internal rendering surface,
         # the idea is to render everything to 'display' and then scale it up to 'screen'
-        self.screen = pygame.display.set_mode((640, 480))
+        self.screen = pygame.display.set_mode(window_size)
         self.display = pygame.Surface((320, 240), pygame.SRCALPHA)
         # Here goes everything that doesn't have outlines
         self.display_2 = pygame.Surface((320, 240))
+        self.outline = OutlineRenderer(self.display.get_size(), mode=OUTLINE_MODE)
+        self.presenter = Presenter(
+            self.screen, self.display_2, integer_scaling=integer_scaling
+        )
+        # Reused by the level transition, the circle is redrawn on it every frame
+        self.transition_surf = pygame.Surface(self.display.get_size())
+        self.transition_surf.set_colorkey((255, 255, 255))
+        # Draw commands for 'display_2' and 'display', see scripts/renderer.py
+        self.background_queue = RenderQueue(self.display_2.get_size())
+        self.render_queue = RenderQueue(self.display.get_size())
 
         self.clock = pygame.time.Clock()
+        # Per phase frame timings, the overlay is toggled with F3
+        self.profiler = Profiler()
+        self.show_profiler = False
+        self.profile_path = None
 
         self.movement = [False, False]
+        # Buttons pressed since the last simulation step, as INPUT_* flags
+        self.pressed = 0
+        # From the asset pack if it has been built, see scripts/assets.py
+        images = load_image_store()
+        # Flipped, scaled and tinted variants of the assets, made once when needed
+        self.transforms = TransformCache()
         self.assets = {
-            "decor": load_images("/tiles/decor"),
-            "grass": load_images("/tiles/grass"),
-            "large_decor": load_images("/tiles/large_decor"),
-            "stone": load_images("/tiles/stone"),
-            "player": load_image("/entities/player.png"),
-            "background": load_image("/background.png"),
-            "clouds": load_images("/clouds"),
-            "enemy/idle": Animation(load_images("/entities/enemy/idle"), img_dur=6),
-            "enemy/run": Animation(load_images("/entities/enemy/run"), img_dur=4),
-            "player/idle": Animation(load_images("/entities/player/idle"), img_dur=6),
-            "player/run": Animation(load_images("/entities/player/run"), img_dur=4),
-            "player/jump": Animation(load_images("/entities/player/jump")),
-            "player/slide": Animation(load_images("/entities/player/slide")),
-            "player/wall_slide": Animation(load_images("/entities/player/wall_slide")),
+            "decor": images.images("/tiles/decor"),
+            "grass": images.images("/tiles/grass"),
+            "large_decor": images.images("/tiles/large_decor"),
+            "stone": images.images("/tiles/stone"),
+            "player": images.image("/entities/player.png"),
+            "background": images.image("/background.png"),
+            "clouds": images.images("/clouds"),
+            "enemy/idle": Animation(images.images("/entities/enemy/idle"), img_dur=6),
+            "enemy/run": Animation(images.images("/entities/enemy/run"), img_dur=4),
+            "player/idle": Animation(images.images("/entities/player/idle"), img_dur=6),
+            "player/run": Animation(images.images("/entities/player/run"), img_dur=4),
+            "player/jump": Animation(images.images("/entities/player/jump")),
+            "player/slide": Animation(images.images("/entities/player/slide")),
+            "player/wall_slide": Animation(
+                images.images("/entities/player/wall_slide")
+            ),
             "particle/leaf": Animation(
-                load_images("/particles/leaf"), img_dur=20, loop=False
+                images.images("/particles/leaf"), img_dur=20, loop=False
             ),
             "particle/particle": Animation(
-                load_images("/particles/particle"), img_dur=6, loop=False
+                images.images("/particles/particle"), img_dur=6, loop=False
             ),
-            "gun": load_image("/gun.png"),
-            "projectile": load_image("/projectile.png"),
+            "gun": images.image("/gun.png"),
+            "projectile": images.image("/projectile.png"),
         }
 
         BASE_SFX_PATH = DATA_PATH / "sfx"
 
-        self.sfx = {
-            "jump": pygame.mixer.Sound(f"{BASE_SFX_PATH}/jump.wav"),
-            "dash": pygame.mixer.Sound(f"{BASE_SFX_PATH}/dash.wav"),
-            "hit": pygame.mixer.Sound(f"{BASE_SFX_PATH}/hit.wav"),
-            "shoot": pygame.mixer.Sound(f"{BASE_SFX_PATH}/shoot.wav"),
-            "ambience": pygame.mixer.Sound(f"{BASE_SFX_PATH}/ambience.wav"),
-        }
+        if headless:
+            self.sfx = {
+                name: SilentSound()
+                for name in ["jump", "dash", "hit", "shoot", "ambience"]
+            }
+        else:
+            self.sfx = load_sounds(
+                {
+                    "jump": BASE_SFX_PATH / "jump.wav",
+                    "dash": BASE_SFX_PATH / "dash.wav",
+                    "hit": BASE_SFX_PATH / "hit.wav",
+                    "shoot": BASE_SFX_PATH / "shoot.wav",
+                    "ambience": BASE_SFX_PATH / "ambience.wav",
+                }
+            )
 
         self.sfx["ambience"].set_volume(0.2)
         self.sfx["shoot"].set_volume(0.4)
@@ -73,245 +168,436 @@ class Game:
         self.sfx["dash"].set_volume(0.3)
         self.sfx["jump"].set_volume(0.7)
 
-        self.clouds = Clouds(self.assets["clouds"], count=16)
+        self.clouds = Clouds(self.assets["clouds"], count=16, rng=self.rng)
 
         self.player = Player(self, (50, 50), (8, 15))
 
         self.leaf_spawners = []
         self.enemies = []
-        self.particles = []
-        self.projectiles = []
-        self.sparks = []
+        self.particles = ParticleSystem(self)
+        self.projectiles = ProjectileSystem(self)
+        # Candidates for the entity and projectile interactions, see scripts/broadphase.py
+        self.broad_phase = BroadPhase()
+        self.sparks = SparkSystem()
         self.scroll = [0.0, 0.0]
+        self.prev_scroll = [0.0, 0.0]
         self.dead = 0
-        self.level = 0
+        self.level = level
         self.level_transition = -30
+        self.frame = 0
 
-        self.tile_map = TileMap(self, tile_size=16)
+        self.levels = LevelManager(self, DATA_PATH / "maps")
         self.load_level(self.level)
 
         self.screen_shake = 0
+        self.screen_shake_offset = (0, 0)
 
     def load_level(self, map_id):
-        self.tile_map.load(DATA_PATH / "maps" / f"{map_id}.json")
-        self.leaf_spawners = []
-        for tree in self.tile_map.extract([("large_decor", 2)], keep=True):
-            self.leaf_spawners.append(
-                pygame.Rect(4 + tree["pos"][0], 4 + tree["pos"][1], 23, 13)
-            )
-
-        self.enemies = []
-        for spawner in self.tile_map.extract([("spawners", 0), ("spawners", 1)]):
-            if spawner["variant"] == 0:
-                self.player.pos = spawner["pos"]
-                self.player.air_time = 0
-            else:
-                self.enemies.append(Enemy(self, spawner["pos"], (8, 15)))
-
-        self.particles = []
-        self.projectiles = []
-        self.sparks = []
+        # Levels come parsed from the level manager, which also keeps the last few
+        # around (a respawn doesn't reload anything) and loads the next one ahead
+        level = self.levels.get(map_id)
+        self.tile_map = level.tile_map
+        self.leaf_spawners = level.leaf_spawners
+        if level.player_pos is not None:
+            self.player.pos = list(level.player_pos)
+            self.player.air_time = 0
+            self.player.save_state()
+        self.enemies = [Enemy(self, pos, (8, 15)) for pos in level.enemy_positions]
+        self.levels.prefetch(map_id + 1)
+
+        self.particles.clear()
+        self.projectiles.clear()
+        self.sparks.clear()
 
         self.scroll = [0.0, 0.0]
+        self.prev_scroll = [0.0, 0.0]
         self.dead = 0
         self.level_transition = -30
 
-    def run(self):
-        pygame.mixer.music.load(DATA_PATH / "music.wav")
-        pygame.mixer.music.set_volume(0.3)
-        pygame.mixer.music.play(-1)
-
-        self.sfx["ambience"].play(-1)
+    def current_input(self):
+        return (
+            (INPUT_LEFT if self.movement[0] else 0)
+            | (INPUT_RIGHT if self.movement[1] else 0)
+            | self.pressed
+        )
+
+    def apply_input(self, inputs):
+        self.movement[0] = bool(inputs & INPUT_LEFT)
+        self.movement[1] = bool(inputs & INPUT_RIGHT)
+        if inputs & INPUT_JUMP:
+            if self.player.jump():
+                self.sfx["jump"].play()
+        if inputs & INPUT_DASH:
+            self.player.dash()
+
+    def stream_areas(self):
+        # Everything that needs the tiles around it this step: the view, the
+        # entities and the projectiles (as points)
+        areas = [(self.scroll[0], self.scroll[1], *self.display.get_size())]
+        areas.append(self.player.rect())
+        areas.extend(enemy.rect() for enemy in self.enemies)
+        projectiles = self.projectiles
+        pool = projectiles.pool
+        for i in range(pool.count):
+            slot = (pool.head + i) % pool.capacity
+            areas.append((projectiles.xs[slot], projectiles.ys[slot], 0, 0))
+        return areas
+
+    def update(self, inputs=None):
+        # One fixed simulation step, everything in here advances at SIMULATION_RATE.
+        # 'inputs' are INPUT_* flags, by default the ones from the replay being played
+        # or else the ones collected from the keyboard.
+        if inputs is None:
+            if self.replay is not None and self.frame < len(self.replay):
+                inputs = self.replay.inputs[self.frame]
+            else:
+                inputs = self.current_input()
+        if self.recording is not None:
+            self.recording.record(inputs)
+        self.pressed = 0
+        self.apply_input(inputs)
+        self.frame += 1
+
+        self.player.save_state()
+        for enemy in self.enemies:
+            enemy.save_state()
+        self.prev_scroll[0] = self.scroll[0]
+        self.prev_scroll[1] = self.scroll[1]
+
+        self.screen_shake = max(0, self.screen_shake - 1)
+
+        if not len(self.enemies):
+            self.level_transition += 1
+            if self.level_transition > 30:
+                self.level = min(self.level + 1, self.levels.last_level)
+                self.load_level(self.level)
+        if self.level_transition < 0:
+            self.level_transition += 1
+
+        if self.dead:
+            self.dead += 1
+            if self.dead >= 10:
+                self.level_transition = min(30, self.level_transition + 1)
+            if self.dead > 40:
+                self.load_level(self.level)
+
+        self.scroll[0] += (
+            # The X position of the center of the player in the world, not on display
+            self.player.rect().centerx
+            # The camera is positioned in the top-left corner, so we subtract half the display width
+            - self.display.get_width() / 2
+            - self.scroll[0]
+        ) / 30
+        self.scroll[1] += (
+            self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]
+        ) / 30
+
+        for rect in self.leaf_spawners:
+            if self.rng.random() * 49999 < rect.width * rect.height:
+                pos = (
+                    rect.x + self.rng.random() * rect.width,
+                    rect.y + self.rng.random() * rect.height,
+                )
+                self.particles.spawn(
+                    "leaf",
+                    pos,
+                    velocity=[-0.1, 0.3],
+                    frame=self.rng.randint(0, 20),
+                )
 
-        while True:
-            self.display.fill((0, 0, 0, 0))
-            self.display_2.blit(self.assets["background"], (0, 0))
+        self.clouds.update()
 
-            self.screen_shake = max(0, self.screen_shake - 1)
+        if self.tile_map.paged_map is not None:
+            with self.profiler.scope("update.stream"):
+                self.tile_map.stream(self.stream_areas())
 
-            if not len(self.enemies):
-                self.level_transition += 1
-                if self.level_transition > 30:
-                    self.level = min(
-                        self.level + 1, len(os.listdir(DATA_PATH / "maps")) - 1
-                    )
-                    self.load_level(self.level)
-            if self.level_transition < 0:
-                self.level_transition += 1
-
-            if self.dead:
-                self.dead += 1
-                if self.dead >= 10:
-                    self.level_transition = min(30, self.level_transition + 1)
-                if self.dead > 40:
-                    self.load_level(self.level)
-
-            self.scroll[0] += (
-                # The X position of the center of the player in the world, not on display
-                self.player.rect().centerx
-                # The camera is positioned in the top-left corner, so we subtract half the display width
-                - self.display.get_width() / 2
-                - self.scroll[0]
-            ) / 30
-            self.scroll[1] += (
-                self.player.rect().centery
-                - self.display.get_height() / 2
-                - self.scroll[1]
-            ) / 30
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
-
-            for rect in self.leaf_spawners:
-                if random.random() * 49999 < rect.width * rect.height:
-                    pos = (
-                        rect.x + random.random() * rect.width,
-                        rect.y + random.random() * rect.height,
-                    )
-                    self.particles.append(
-                        Particle(
-                            self,
-                            "leaf",
-                            pos,
-                            velocity=[-0.1, 0.3],
-                            frame=random.randint(0, 20),
-                        )
-                    )
-
-            self.clouds.update()
-            self.clouds.render(self.display_2, offset=render_scroll)
-            self.tile_map.render(self.display, offset=render_scroll)
-
-            for enemy in self.enemies.copy():
-                kill = enemy.update(self.tile_map, (0, 0))
-                enemy.render(self.display, offset=render_scroll)
-                if kill:
+        with self.profiler.scope("update.enemies"):
+            for enemy in self.enemies:
+                enemy.update(self.tile_map, (0, 0))
+            # Dashing through enemies kills them
+            if abs(self.player.dashing) >= 50:
+                self.broad_phase.rebuild_entities(self.enemies)
+                for enemy in self.broad_phase.entities_in(self.player.rect()):
+                    enemy.die()
                     self.enemies.remove(enemy)
 
+        with self.profiler.scope("update.player"):
             if not self.dead:
                 self.player.update(
                     self.tile_map, (self.movement[1] - self.movement[0], 0)
                 )
-                self.player.render(self.display, offset=render_scroll)
-
-            # [[x,y],direction, timer]
-            for projectile in self.projectiles.copy():
-                projectile[0][0] += projectile[1]
-                projectile[2] += 1
-                img = self.assets["projectile"]
-                self.display.blit(
-                    img,
-                    (
-                        projectile[0][0] - img.get_width() / 2 - render_scroll[0],
-                        projectile[0][1] - img.get_height() / 2 - render_scroll[1],
-                    ),
-                )
-                if self.tile_map.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile)
-                    for i in range(4):
-                        self.sparks.append(
-                            Spark(
-                                projectile[0],
-                                random.random()
-                                - 0.5
-                                + (math.pi if projectile[1] > 0 else 0),
-                                2 + random.random(),
-                            )
+
+        with self.profiler.scope("update.projectiles"):
+            for hit in self.projectiles.update(self.tile_map):
+                for i in range(4):
+                    self.sparks.spawn(
+                        hit[:2],
+                        self.rng.random() - 0.5 + (math.pi if hit[2] > 0 else 0),
+                        2 + self.rng.random(),
+                    )
+            if abs(self.player.dashing) < 50 and len(self.projectiles):
+                self.broad_phase.rebuild_projectiles(self.projectiles)
+                player_rect = self.player.rect()
+                for hit in self.projectiles.collide_rect(
+                    player_rect, self.broad_phase.projectiles_near(player_rect)
+                ):
+                    self.dead += 1
+                    self.sfx["hit"].play()
+                    self.screen_shake = max(16, self.screen_shake)
+                    for i in range(30):
+                        angle = self.rng.random() * math.pi * 2
+                        speed = self.rng.random() * 5
+                        self.sparks.spawn(
+                            self.player.rect().center,
+                            angle,
+                            2 + self.rng.random(),
                         )
-                elif projectile[2] > 360:
-                    self.projectiles.remove(projectile)
-                elif abs(self.player.dashing) < 50:
-                    if self.player.rect().collidepoint(projectile[0]):
-                        self.projectiles.remove(projectile)
-                        self.dead += 1
-                        self.sfx["hit"].play()
-                        self.screen_shake = max(16, self.screen_shake)
-                        for i in range(30):
-                            angle = random.random() * math.pi * 2
-                            speed = random.random() * 5
-                            self.sparks.append(
-                                Spark(
-                                    self.player.rect().center,
-                                    angle,
-                                    2 + random.random(),
-                                )
-                            )
-                            self.particles.append(
-                                Particle(
-                                    self,
-                                    "particle",
-                                    self.player.rect().center,
-                                    velocity=[
-                                        math.cos(angle + math.pi) * speed * 0.5,
-                                        math.sin(angle + math.pi) * speed * 0.5,
-                                    ],
-                                    frame=random.randint(0, 7),
-                                )
-                            )
-
-            for spark in self.sparks.copy():
-                kill = spark.update()
-                spark.render(self.display, offset=render_scroll)
-                if kill:
-                    self.sparks.remove(spark)
-
-            display_mask = pygame.mask.from_surface(self.display)
-            display_sillhouette = display_mask.to_surface(
-                setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0)
-            )
-            for offset in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                self.display_2.blit(display_sillhouette, offset)
-
-            for particle in self.particles.copy():
-                kill = particle.update()
-                particle.render(self.display, offset=render_scroll)
-                if particle.type == "leaf":
-                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
-                if kill:
-                    self.particles.remove(particle)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT:
-                        self.movement[0] = True
-                    if event.key == pygame.K_RIGHT:
-                        self.movement[1] = True
-                    if event.key == pygame.K_UP:
-                        if self.player.jump():
-                            self.sfx["jump"].play()
-                    if event.key == pygame.K_x:
-                        self.player.dash()
-                if event.type == pygame.KEYUP:
-                    if event.key == pygame.K_LEFT:
-                        self.movement[0] = False
-                    if event.key == pygame.K_RIGHT:
-                        self.movement[1] = False
-
-            if self.level_transition:
-                transition_surf = pygame.Surface(self.display.get_size())
-                pygame.draw.circle(
-                    transition_surf,
-                    (255, 255, 255),
-                    (self.display.get_width() // 2, self.display.get_height() // 2),
-                    (30 - abs(self.level_transition)) * 8,
+                        self.particles.spawn(
+                            "particle",
+                            self.player.rect().center,
+                            velocity=[
+                                math.cos(angle + math.pi) * speed * 0.5,
+                                math.sin(angle + math.pi) * speed * 0.5,
+                            ],
+                            frame=self.rng.randint(0, 7),
+                        )
+
+        with self.profiler.scope("update.sparks"):
+            self.sparks.update()
+        with self.profiler.scope("update.particles"):
+            self.particles.update()
+
+        self.screen_shake_offset = (
+            self.rng.random() * self.screen_shake - self.screen_shake / 2,
+            self.rng.random() * self.screen_shake - self.screen_shake / 2,
+        )
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.quit()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_LEFT:
+                    self.movement[0] = True
+                if event.key == pygame.K_RIGHT:
+                    self.movement[1] = True
+                if event.key == pygame.K_UP:
+                    self.pressed |= INPUT_JUMP
+                if event.key == pygame.K_x:
+                    self.pressed |= INPUT_DASH
+                if event.key == pygame.K_F3:
+                    self.show_profiler = not self.show_profiler
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_LEFT:
+                    self.movement[0] = False
+                if event.key == pygame.K_RIGHT:
+                    self.movement[1] = False
+
+    def quit(self):
+        if self.recording is not None:
+            self.recording.save(self.record_path)
+        if self.profile_path is not None:
+            self.profiler.export(self.profile_path)
+        pygame.quit()
+        sys.exit()
+
+    def step(self, frames=1, inputs=()):
+        # Simulates 'frames' steps without rendering, 'inputs' holds the INPUT_* flags
+        # for each step (steps past its end get no input), and returns the final state
+        inputs = list(inputs)
+        for i in range(frames):
+            with self.profiler.scope("frame"):
+                self.update(inputs[i] if i < len(inputs) else 0)
+            self.profiler.end_frame()
+        return self.state()
+
+    def state(self):
+        return {
+            "frame": self.frame,
+            "level": self.level,
+            "dead": self.dead,
+            "player": {
+                "pos": list(self.player.pos),
+                "velocity": list(self.player.velocity),
+                "action": self.player.action,
+            },
+            "enemies": [list(enemy.pos) for enemy in self.enemies],
+            "projectiles": len(self.projectiles),
+            "sparks": len(self.sparks),
+            "particles": len(self.particles),
+        }
+
+    def render(self, alpha=1.0):
+        # Draws the current state, 'alpha' is how far we are between the previous
+        # simulation step and the current one, the camera and the entities are
+        # drawn in between the two so motion stays smooth at any render rate
+        self.display.fill((0, 0, 0, 0))
+
+        render_scroll = (
+            int(self.prev_scroll[0] + (self.scroll[0] - self.prev_scroll[0]) * alpha),
+            int(self.prev_scroll[1] + (self.scroll[1] - self.prev_scroll[1]) * alpha),
+        )
+
+        # Everything submits its sprites to the queues first, then each queue is
+        # drawn layer by layer with one fblits call per layer
+        self.background_queue.submit(
+            self.assets["background"], (0, 0), LAYER_BACKGROUND
+        )
+        self.clouds.submit(self.background_queue, offset=render_scroll)
+        with self.profiler.scope("render.tiles"):
+            self.tile_map.submit(self.render_queue, offset=render_scroll)
+
+        with self.profiler.scope("render.entities"):
+            for enemy in self.enemies:
+                enemy.submit(
+                    self.render_queue,
+                    offset=enemy.interpolated_offset(render_scroll, alpha),
+                )
+
+            if not self.dead:
+                self.player.submit(
+                    self.render_queue,
+                    offset=self.player.interpolated_offset(render_scroll, alpha),
                 )
-                transition_surf.set_colorkey((255, 255, 255))
-                self.display.blit(transition_surf, (0, 0))
 
-            self.display_2.blit(self.display, (0, 0))
+        with self.profiler.scope("render.projectiles"):
+            self.projectiles.submit(self.render_queue, render_scroll, alpha)
 
-            screen_shake_offset = (
-                random.random() * self.screen_shake - self.screen_shake / 2,
-                random.random() * self.screen_shake - self.screen_shake / 2,
-            )
-            self.screen.blit(
-                pygame.transform.scale(self.display_2, self.screen.get_size()),
-                screen_shake_offset,
+        with self.profiler.scope("render.flush"):
+            self.background_queue.flush(self.display_2)
+            # The particles are drawn after the outlines, so they don't get one
+            self.render_queue.flush(self.display, until=LAYER_PARTICLES)
+
+        with self.profiler.scope("render.sparks"):
+            self.sparks.render(self.display, render_scroll, alpha)
+
+        with self.profiler.scope("render.outline"):
+            self.outline.render(self.display, self.display_2)
+
+        with self.profiler.scope("render.particles"):
+            self.particles.submit(self.render_queue, render_scroll, alpha)
+            self.render_queue.flush(self.display)
+
+        if self.level_transition:
+            self.transition_surf.fill((0, 0, 0))
+            pygame.draw.circle(
+                self.transition_surf,
+                (255, 255, 255),
+                (self.display.get_width() // 2, self.display.get_height() // 2),
+                (30 - abs(self.level_transition)) * 8,
             )
+            self.display.blit(self.transition_surf, (0, 0))
+
+        self.display_2.blit(self.display, (0, 0))
+
+        with self.profiler.scope("present.scale"):
+            self.presenter.present(self.display_2, self.screen_shake_offset)
+        if self.show_profiler:
+            self.profiler.render(self.screen)
+        with self.profiler.scope("present.update"):
             pygame.display.update()
-            self.clock.tick(60)
+
+    def run(self, record_path=None, replay=None, profile_path=None):
+        # The inputs of every step are saved to 'record_path' on quit, a 'replay'
+        # (recorded from the same seed and level) drives the game until it runs out
+        # and the frame timings are exported to 'profile_path' on quit
+        if record_path is not None:
+            self.recording = Replay(self.seed, self.level)
+            self.record_path = record_path
+        self.replay = replay
+        self.profile_path = profile_path
+
+        pygame.mixer.music.load(DATA_PATH / "music.wav")
+        pygame.mixer.music.set_volume(0.3)
+        pygame.mixer.music.play(-1)
+
+        self.sfx["ambience"].play(-1)
+
+        # Fixed timestep: real time is accumulated and consumed in SIMULATION_RATE
+        # steps, so the game runs at the same speed no matter how fast it renders
+        step = 1 / SIMULATION_RATE
+        accumulator = 0.0
+        previous_time = time.perf_counter()
+        while True:
+            current_time = time.perf_counter()
+            accumulator += min(current_time - previous_time, MAX_FRAME_TIME)
+            previous_time = current_time
+
+            with self.profiler.scope("frame"):
+                while accumulator >= step:
+                    self.update()
+                    accumulator -= step
+
+                self.handle_events()
+                self.render(accumulator / step)
+            self.profiler.end_frame()
+            self.clock.tick(RENDER_RATE)
 
 
 if __name__ == "__main__":
-    Game().run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--headless",
+        type=int,
+        metavar="FRAMES",
+        help="simulate FRAMES steps without a window or audio and print the final state",
+    )
+    parser.add_argument("--level", type=int, default=0)
+    parser.add_argument(
+        "--seed", type=seed_arg, help="seed for the game's random numbers"
+    )
+    parser.add_argument(
+        "--record", metavar="FILE", help="save the inputs of the session to FILE"
+    )
+    parser.add_argument("--replay", metavar="FILE", help="play back a recorded session")
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="export the frame timings per phase to FILE (.csv or .json) at the end",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="with --replay, simulate without rendering and print the final state",
+    )
+    parser.add_argument(
+        "--window",
+        metavar="WxH",
+        type=window_size_arg,
+        default=f"{WINDOW_SIZE[0]}x{WINDOW_SIZE[1]}",
+        help="window size (default %(default)s)",
+    )
+    parser.add_argument(
+        "--integer-scaling",
+        action="store_true",
+        help="only scale the game by whole numbers, centered in the window",
+    )
+    args = parser.parse_args()
+    window_size = args.window
+
+    if args.replay is not None:
+        replay = Replay.load(args.replay)
+        if args.fast:
+            game = Game(headless=True, level=replay.level, seed=replay.seed)
+            print(json.dumps(game.step(len(replay), replay.inputs)))
+            if args.profile is not None:
+                game.profiler.export(args.profile)
+        else:
+            Game(
+                level=replay.level,
+                seed=replay.seed,
+                window_size=window_size,
+                integer_scaling=args.integer_scaling,
+            ).run(replay=replay, profile_path=args.profile)
+    elif args.headless is not None:
+        game = Game(headless=True, level=args.level, seed=args.seed)
+        print(json.dumps(game.step(args.headless)))
+        if args.profile is not None:
+            game.profiler.export(args.profile)
+    else:
+        Game(
+            level=args.level,
+            seed=args.seed,
+            window_size=window_size,
+            integer_scaling=args.integer_scaling,
+        ).run(record_path=args.record, profile_path=args.profile)
@@ -0,0 +1,197 @@
+import io
+import json
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pygame
+
+from scripts.atlas import TextureAtlas
+from scripts.utils import BASE_IMG_PATH
+
+# All the images in data/images decoded into one file, so startup is a single read
+# instead of hundreds of small file opens. Rebuild it after changing any image with:
+#   python -m scripts.assets
+# Until then the images are loaded from data/images, see load_image_store.
+PACK_PATH = BASE_IMG_PATH.parent / "images.pack"
+PACK_MAGIC = b"NJPK"
+PACK_VERSION = 2
+# Magic, version and the byte size of the JSON manifest that follows the header.
+# The manifest has "images", mapping every image path to [offset, width, height]
+# of its RGB pixels (the offsets start right after the manifest), and "sources",
+# mapping them to [size, mtime_ns] of the PNG files the pack was built from.
+PACK_HEADER = struct.Struct("<4sBI")
+
+
+def decode_image(path):
+    # Runs on the worker threads, reading and decoding the PNG doesn't need the
+    # display so it can happen off the main thread
+    return pygame.image.load(path)
+
+
+def image_paths(image_dir):
+    # Every image under 'image_dir', as "dir/name.png" paths relative to it
+    paths = []
+    for root, dirs, files in os.walk(image_dir):
+        for name in files:
+            if name.endswith(".png"):
+                paths.append(Path(root, name).relative_to(image_dir).as_posix())
+    return sorted(paths)
+
+
+def source_stamps(image_dir, paths):
+    stamps = {}
+    for path in paths:
+        stat = os.stat(os.path.join(image_dir, path))
+        stamps[path] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def pack_is_current(pack_path=PACK_PATH, image_dir=BASE_IMG_PATH):
+    # Whether the pack was built from the images as they are now. Without the
+    # image directory (e.g. a build that only ships the pack) it is trusted.
+    if not os.path.isdir(image_dir):
+        return True
+    with open(pack_path, "rb") as f:
+        header = f.read(PACK_HEADER.size)
+        if len(header) < PACK_HEADER.size:
+            return False
+        magic, version, manifest_size = PACK_HEADER.unpack(header)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            return False
+        manifest = json.loads(f.read(manifest_size))
+    return manifest["sources"] == source_stamps(image_dir, image_paths(image_dir))
+
+
+class ImageStore:
+    def __init__(self, images, page_size=512):
+        # 'images' maps "dir/name.png" paths to converted, color keyed surfaces,
+        # they are copied into a texture atlas and the store hands out its sprites
+        self.atlas = TextureAtlas(page_size=page_size)
+        indices = {}
+        # Tallest first, so the shelves waste less space
+        for path in sorted(images, key=lambda path: -images[path].get_height()):
+            indices[path] = self.atlas.add(images[path])
+        self.surfaces = {}
+        self.directories = {}
+        for path in sorted(images):
+            sprite = self.atlas.sprite(indices[path])
+            self.surfaces[path] = sprite
+            directory, _, name = path.rpartition("/")
+            self.directories.setdefault(directory, []).append(sprite)
+
+    def image(self, path):
+        return self.surfaces[path.strip("/")]
+
+    def images(self, path):
+        # The images of a directory sorted by file name, like load_images
+        return list(self.directories[path.strip("/")])
+
+    @staticmethod
+    def prepare(img):
+        img = img.convert()
+        img.set_colorkey((0, 0, 0))
+        return img
+
+    @classmethod
+    def from_directory(cls, image_dir=BASE_IMG_PATH, workers=None):
+        paths = image_paths(image_dir)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            decoded = executor.map(
+                decode_image, [os.path.join(image_dir, path) for path in paths]
+            )
+            # convert() needs the display, so it stays on this thread
+            return cls({path: cls.prepare(img) for path, img in zip(paths, decoded)})
+
+    @classmethod
+    def from_pack(cls, pack_path=PACK_PATH, use_mmap=False):
+        with open(pack_path, "rb") as f:
+            if use_mmap:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                data = f.read()
+        try:
+            view = memoryview(data)
+            magic, version, manifest_size = PACK_HEADER.unpack_from(view)
+            if magic != PACK_MAGIC:
+                raise ValueError(f"{pack_path} is not an asset pack")
+            if version != PACK_VERSION:
+                raise ValueError(f"Unsupported asset pack version {version}")
+            start = PACK_HEADER.size + manifest_size
+            manifest = json.loads(bytes(view[PACK_HEADER.size : start]))
+            images = {}
+            source = None
+            for path, (offset, width, height) in manifest["images"].items():
+                # frombuffer doesn't copy, convert() makes the copy that is kept
+                source = pygame.image.frombuffer(
+                    view[start + offset : start + offset + width * height * 3],
+                    (width, height),
+                    "RGB",
+                )
+                images[path] = cls.prepare(source)
+            # The mmap can only be closed once nothing points into it anymore
+            del source
+            view.release()
+        finally:
+            if use_mmap:
+                data.close()
+        return cls(images)
+
+
+def load_image_store(pack_path=PACK_PATH, image_dir=BASE_IMG_PATH, use_mmap=False):
+    # The pack when it's up to date, otherwise the loose files on a thread pool
+    if os.path.exists(pack_path):
+        if pack_is_current(pack_path, image_dir):
+            return ImageStore.from_pack(pack_path, use_mmap=use_mmap)
+        print(
+            f"{pack_path} is out of date, loading {image_dir} instead "
+            "(rebuild it with: python -m scripts.assets)"
+        )
+    return ImageStore.from_directory(image_dir)
+
+
+def build_pack(image_dir=BASE_IMG_PATH, pack_path=PACK_PATH, workers=None):
+    paths = image_paths(image_dir)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        decoded = list(
+            executor.map(
+                decode_image, [os.path.join(image_dir, path) for path in paths]
+            )
+        )
+
+    images = {}
+    pixels = io.BytesIO()
+    for path, img in zip(paths, decoded):
+        images[path] = [pixels.tell(), img.get_width(), img.get_height()]
+        pixels.write(pygame.image.tobytes(img, "RGB"))
+    manifest = {"images": images, "sources": source_stamps(image_dir, paths)}
+    manifest = json.dumps(manifest, separators=(",", ":")).encode()
+
+    with open(pack_path, "wb") as f:
+        f.write(PACK_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(manifest)))
+        f.write(manifest)
+        f.write(pixels.getbuffer())
+    return len(paths)
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_sounds(paths, workers=None):
+    # 'paths' maps names to sound files, the files are read on a thread pool and
+    # the mixer decodes them from memory
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        contents = executor.map(read_file, paths.values())
+        return {
+            name: pygame.mixer.Sound(file=io.BytesIO(content))
+            for name, content in zip(paths, contents)
+        }
+
+
+if __name__ == "__main__":
+    count = build_pack()
+    print(f"Packed {count} images into {PACK_PATH}")
@@ -0,0 +1,62 @@
+import pygame
+
+
+class TextureAtlas:
+    def __init__(self, page_size=512, padding=1, colorkey=(0, 0, 0)):
+        # Sprites are packed into a few large pages, shelf by shelf, and handed out
+        # as subsurfaces so they share the pixels of their page. The subsurfaces
+        # are drawn like any other surface, batched by the fblits calls of the
+        # render queues. A sprite is addressed by its index, the order it was added in.
+        self.page_size = page_size
+        self.padding = padding
+        self.colorkey = colorkey
+        self.pages = []
+        self.sprites = []
+        # The page being filled and where the next sprite goes on it
+        self.current = None
+        self.shelf_x = 0
+        self.shelf_y = 0
+        self.shelf_height = 0
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def new_page(self, size):
+        page = pygame.Surface(size).convert()
+        page.fill(self.colorkey)
+        page.set_colorkey(self.colorkey)
+        self.pages.append(page)
+        return len(self.pages) - 1
+
+    def place(self, width, height):
+        # Returns the page index and position for a sprite of this size
+        if width > self.page_size or height > self.page_size:
+            # Too big to share a page, it gets one of its own
+            return self.new_page((width, height)), (0, 0)
+
+        if self.current is not None and self.shelf_x + width > self.page_size:
+            self.shelf_x = 0
+            self.shelf_y += self.shelf_height
+            self.shelf_height = 0
+        if self.current is None or self.shelf_y + height > self.page_size:
+            self.current = self.new_page((self.page_size, self.page_size))
+            self.shelf_x = 0
+            self.shelf_y = 0
+            self.shelf_height = 0
+        pos = (self.shelf_x, self.shelf_y)
+        self.shelf_x += width + self.padding
+        self.shelf_height = max(self.shelf_height, height + self.padding)
+        return self.current, pos
+
+    def add(self, img):
+        page_index, pos = self.place(img.get_width(), img.get_height())
+        page = self.pages[page_index]
+        rect = pygame.Rect(pos, img.get_size())
+        page.blit(img, pos)
+        sprite = page.subsurface(rect)
+        sprite.set_colorkey(self.colorkey)
+        self.sprites.append(sprite)
+        return len(self.sprites) - 1
+
+    def sprite(self, index):
+        return self.sprites[index]
@@ -0,0 +1,58 @@
+import pygame
+
+from scripts.spatial import SpatialHash
+
+
+class BroadPhase:
+    def __init__(self, cell_size=32):
+        # Rebuilt in the simulation steps that query it, so interactions don't have
+        # to check every pair: the entities in a SpatialHash by their rects, and the
+        # live projectile slots bucketed by the cell they're in (projectiles are points)
+        self.cell_size = cell_size
+        self.entities = SpatialHash(cell_size)
+        self.projectile_cells = {}
+        # Where the pool's ring buffer started, to sort slots oldest first
+        self.projectile_head = 0
+        self.projectile_capacity = 1
+
+    def rebuild_entities(self, entities):
+        self.entities.clear()
+        for entity in entities:
+            self.entities.insert(entity, entity.rect())
+
+    def rebuild_projectiles(self, projectiles):
+        cells = self.projectile_cells
+        cells.clear()
+        pool = projectiles.pool
+        xs = projectiles.xs
+        ys = projectiles.ys
+        cell_size = self.cell_size
+        for i in range(pool.count):
+            slot = (pool.head + i) % pool.capacity
+            cell = (int(xs[slot] // cell_size), int(ys[slot] // cell_size))
+            slots = cells.get(cell)
+            if slots is None:
+                cells[cell] = [slot]
+            else:
+                slots.append(slot)
+        self.projectile_head = pool.head
+        self.projectile_capacity = pool.capacity
+
+    def entities_in(self, rect):
+        # The entities overlapping the rect, in the order they were added
+        return self.entities.query(rect)
+
+    def projectiles_near(self, rect):
+        # The projectile slots in the cells the rect touches, oldest first. These
+        # are only candidates, see ProjectileSystem.collide_rect for the exact check.
+        rect = pygame.Rect(rect)
+        cells = self.projectile_cells
+        found = []
+        for cell in self.entities.cells(rect):
+            slots = cells.get(cell)
+            if slots is not None:
+                found.extend(slots)
+        head = self.projectile_head
+        capacity = self.projectile_capacity
+        found.sort(key=lambda slot: (slot - head) % capacity)
+        return found
@@ -1,7 +1,11 @@
 import random
 
+from scripts.renderer import LAYER_CLOUDS
+
 
 class Cloud:
+    __slots__ = ("pos", "img", "speed", "depth")
+
     def __init__(self, pos, img, speed, depth):
         self.pos = list(pos)
         self.img = img
@@ -11,30 +15,31 @@ class Cloud:
     def update(self):
         self.pos[0] += self.speed
 
-    def render(self, surf, offset=(0, 0)):
+    def submit(self, queue, offset=(0, 0)):
         render_pos = (
             self.pos[0] - offset[0] * self.depth,
             self.pos[1] - offset[1] * self.depth,
         )
-        surf.blit(
+        queue.submit(
             self.img,
             (
-                render_pos[0] % (surf.get_width() + self.img.get_width())
+                render_pos[0] % (queue.size[0] + self.img.get_width())
                 - self.img.get_width(),
-                render_pos[1] % (surf.get_height() + self.img.get_height())
+                render_pos[1] % (queue.size[1] + self.img.get_height())
                 - self.img.get_height(),
             ),
+            LAYER_CLOUDS,
         )
 
 
 class Clouds:
-    def __init__(self, cloud_images, count=16):
+    def __init__(self, cloud_images, count=16, rng=random):
         self.clouds = []
         for _ in range(count):
-            img = random.choice(cloud_images)
-            pos = (random.random() * 99999, random.random() * 99999)
-            speed = random.random() * 0.05 + 0.05
-            depth = random.random() * 0.06 + 0.02
+            img = rng.choice(cloud_images)
+            pos = (rng.random() * 99999, rng.random() * 99999)
+            speed = rng.random() * 0.05 + 0.05
+            depth = rng.random() * 0.06 + 0.02
             self.clouds.append(Cloud(pos, img, speed, depth))
 
         # This will ensure that clouds with lower depth (further away) are rendered first
@@ -44,6 +49,6 @@ class Clouds:
         for cloud in self.clouds:
             cloud.update()
 
-    def render(self, surf, offset=(0, 0)):
+    def submit(self, queue, offset=(0, 0)):
         for cloud in self.clouds:
-            cloud.render(surf, offset)
+            cloud.submit(queue, offset)
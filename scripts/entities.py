@@ -1,26 +1,46 @@
 from __future__ import annotations
 
 import math
-import random
 from typing import TYPE_CHECKING
 
-from scripts.particle import Particle
-from scripts.spark import Spark
-
 if TYPE_CHECKING:
     from game import Game
 
 import pygame
 
+from scripts.renderer import LAYER_ENTITIES
+
+# Bit flags for the sides an entity collided on during its last update
+COLLIDE_UP = 1
+COLLIDE_DOWN = 2
+COLLIDE_LEFT = 4
+COLLIDE_RIGHT = 8
+
 
 class PhysicsEntity:
+    __slots__ = (
+        "game",
+        "type",
+        "pos",
+        "prev_pos",
+        "size",
+        "velocity",
+        "collisions",
+        "action",
+        "anim_offset",
+        "flip",
+        "animation",
+        "last_movement",
+    )
+
     def __init__(self, game: Game, e_type, pos, size):
         self.game = game
         self.type = e_type
         self.pos = list(pos)
+        self.prev_pos = list(pos)
         self.size = size
         self.velocity = [0.0, 0.0]
-        self.collisions = {"up": False, "down": False, "left": False, "right": False}
+        self.collisions = 0
 
         self.action = ""
         self.anim_offset = (-3, -3)
@@ -32,41 +52,51 @@ class PhysicsEntity:
     def rect(self):
         return pygame.Rect(self.pos[0], self.pos[1], self.size[0], self.size[1])
 
+    def save_state(self):
+        # Remembers the position before a simulation step, used to interpolate rendering
+        self.prev_pos[0] = self.pos[0]
+        self.prev_pos[1] = self.pos[1]
+
+    def interpolated_offset(self, offset, alpha):
+        # Camera offset that draws the entity in between its previous and current position
+        return (
+            offset[0] + (self.pos[0] - self.prev_pos[0]) * (1 - alpha),
+            offset[1] + (self.pos[1] - self.prev_pos[1]) * (1 - alpha),
+        )
+
     def set_action(self, action):
         if self.action != action:
             self.action = action
             self.animation = self.game.assets[f"{self.type}/{action}"].copy()
 
     def update(self, tile_map, movement=(0, 0)):
-        self.collisions = {"up": False, "down": False, "left": False, "right": False}
+        self.collisions = 0
 
-        frame_movement = (
-            movement[0] + self.velocity[0],
-            movement[1] + self.velocity[1],
-        )
+        move_x = movement[0] + self.velocity[0]
+        move_y = movement[1] + self.velocity[1]
 
-        self.pos[0] += frame_movement[0]
+        self.pos[0] += move_x
         entity_rect = self.rect()
         for tile_rect in tile_map.physics_rects_around(self.pos):
             if entity_rect.colliderect(tile_rect):
-                if frame_movement[0] > 0:
+                if move_x > 0:
                     entity_rect.right = tile_rect.left
-                    self.collisions["right"] = True
-                if frame_movement[0] < 0:
+                    self.collisions |= COLLIDE_RIGHT
+                if move_x < 0:
                     entity_rect.left = tile_rect.right
-                    self.collisions["left"] = True
+                    self.collisions |= COLLIDE_LEFT
                 self.pos[0] = entity_rect.x
 
-        self.pos[1] += frame_movement[1]
+        self.pos[1] += move_y
         entity_rect = self.rect()
         for tile_rect in tile_map.physics_rects_around(self.pos):
             if entity_rect.colliderect(tile_rect):
-                if frame_movement[1] > 0:
+                if move_y > 0:
                     entity_rect.bottom = tile_rect.top
-                    self.collisions["down"] = True
-                if frame_movement[1] < 0:
+                    self.collisions |= COLLIDE_DOWN
+                if move_y < 0:
                     entity_rect.top = tile_rect.bottom
-                    self.collisions["up"] = True
+                    self.collisions |= COLLIDE_UP
                 self.pos[1] = entity_rect.y
 
         if movement[0] > 0:
@@ -78,18 +108,19 @@ class PhysicsEntity:
 
         self.velocity[1] = min(5, self.velocity[1] + 0.1)
 
-        if self.collisions["down"] or self.collisions["up"]:
+        if self.collisions & (COLLIDE_DOWN | COLLIDE_UP):
             self.velocity[1] = 0.0
 
         self.animation.update()
 
-    def render(self, surf: pygame.Surface, offset=(0, 0)):
-        surf.blit(
-            pygame.transform.flip(self.animation.img(), self.flip, False),
+    def submit(self, queue, offset=(0, 0)):
+        queue.submit(
+            self.animation.img(self.flip),
             (
                 self.pos[0] - offset[0] + self.anim_offset[0],
                 self.pos[1] - offset[1] + self.anim_offset[1],
             ),
+            LAYER_ENTITIES,
         )
         # surf.blit(
         #     self.game.assets["player"],
@@ -98,6 +129,8 @@ class PhysicsEntity:
 
 
 class Enemy(PhysicsEntity):
+    __slots__ = ("walking",)
+
     def __init__(self, game: Game, pos, size):
         super().__init__(game, "enemy", pos, size)
 
@@ -108,7 +141,7 @@ class Enemy(PhysicsEntity):
             if tile_map.solid_check(
                 (self.rect().centerx + (-7 if self.flip else 7), self.pos[1] + 23)
             ):
-                if self.collisions["left"] or self.collisions["right"]:
+                if self.collisions & (COLLIDE_LEFT | COLLIDE_RIGHT):
                     self.flip = not self.flip
                 else:
                     movement = (movement[0] - 0.5 if self.flip else 0.5, movement[1])
@@ -127,34 +160,28 @@ class Enemy(PhysicsEntity):
                     # Enemy is looking to the left and the player is also on the left
                     if self.flip and dis[0] < 0:
                         self.game.sfx["shoot"].play()
-                        self.game.projectiles.append(
-                            [[self.rect().centerx - 7, self.rect().centery], -1.5, 0]
-                        )
+                        shot_pos = (self.rect().centerx - 7, self.rect().centery)
+                        self.game.projectiles.spawn(shot_pos, (-1.5, 0))
                         for i in range(4):
-                            self.game.sparks.append(
-                                Spark(
-                                    self.game.projectiles[-1][0],
-                                    random.random() - 0.5 + math.pi,
-                                    2 + random.random(),
-                                )
+                            self.game.sparks.spawn(
+                                shot_pos,
+                                self.game.rng.random() - 0.5 + math.pi,
+                                2 + self.game.rng.random(),
                             )
 
                     if not self.flip and dis[0] > 0:
                         self.game.sfx["shoot"].play()
-                        self.game.projectiles.append(
-                            [[self.rect().centerx + 7, self.rect().centery], 1.5, 0]
-                        )
+                        shot_pos = (self.rect().centerx + 7, self.rect().centery)
+                        self.game.projectiles.spawn(shot_pos, (1.5, 0))
                         for i in range(4):
-                            self.game.sparks.append(
-                                Spark(
-                                    self.game.projectiles[-1][0],
-                                    random.random() - 0.5,
-                                    2 + random.random(),
-                                )
+                            self.game.sparks.spawn(
+                                shot_pos,
+                                self.game.rng.random() - 0.5,
+                                2 + self.game.rng.random(),
                             )
 
-        elif random.random() < 0.01:
-            self.walking = random.randint(30, 120)
+        elif self.game.rng.random() < 0.01:
+            self.walking = self.game.rng.randint(30, 120)
 
         super().update(tile_map, movement=movement)
 
@@ -163,46 +190,36 @@ class Enemy(PhysicsEntity):
         else:
             self.set_action("idle")
 
-        if abs(self.game.player.dashing) >= 50:
-            if self.rect().colliderect(self.game.player.rect()):
-                self.game.screen_shake = max(16, self.game.screen_shake)
-                self.game.sfx["hit"].play()
-                for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(
-                        Spark(
-                            self.rect().center,
-                            angle,
-                            2 + random.random(),
-                        )
-                    )
-                    self.game.particles.append(
-                        Particle(
-                            self.game,
-                            "particle",
-                            self.rect().center,
-                            velocity=[
-                                math.cos(angle + math.pi) * speed * 0.5,
-                                math.sin(angle + math.pi) * speed * 0.5,
-                            ],
-                            frame=random.randint(0, 7),
-                        )
-                    )
-                self.game.sparks.append(
-                    Spark(self.rect().center, 0, 5 + random.random())
-                )
-                self.game.sparks.append(
-                    Spark(self.rect().center, math.pi, 5 + random.random())
-                )
-                return True
+    def die(self):
+        # Effects of being hit by the player's dash, the game removes the enemy
+        self.game.screen_shake = max(16, self.game.screen_shake)
+        self.game.sfx["hit"].play()
+        for i in range(30):
+            angle = self.game.rng.random() * math.pi * 2
+            speed = self.game.rng.random() * 5
+            self.game.sparks.spawn(
+                self.rect().center,
+                angle,
+                2 + self.game.rng.random(),
+            )
+            self.game.particles.spawn(
+                "particle",
+                self.rect().center,
+                velocity=[
+                    math.cos(angle + math.pi) * speed * 0.5,
+                    math.sin(angle + math.pi) * speed * 0.5,
+                ],
+                frame=self.game.rng.randint(0, 7),
+            )
+        self.game.sparks.spawn(self.rect().center, 0, 5 + self.game.rng.random())
+        self.game.sparks.spawn(self.rect().center, math.pi, 5 + self.game.rng.random())
 
-    def render(self, surf: pygame.Surface, offset=(0, 0)):
-        super().render(surf, offset=offset)
+    def submit(self, queue, offset=(0, 0)):
+        super().submit(queue, offset=offset)
 
         if self.flip:
-            surf.blit(
-                pygame.transform.flip(self.game.assets["gun"], True, False),
+            queue.submit(
+                self.game.transforms.get(self.game.assets["gun"], flip_x=True),
                 (
                     self.rect().centerx
                     - 4
@@ -210,15 +227,19 @@ class Enemy(PhysicsEntity):
                     - offset[0],
                     self.rect().centery - offset[1],
                 ),
+                LAYER_ENTITIES,
             )
         else:
-            surf.blit(
+            queue.submit(
                 self.game.assets["gun"],
                 (self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1]),
+                LAYER_ENTITIES,
             )
 
 
 class Player(PhysicsEntity):
+    __slots__ = ("air_time", "jumps", "wall_slide", "dashing")
+
     def __init__(self, game: Game, pos, size):
         super().__init__(game, "player", pos, size)
         self.air_time = 0
@@ -236,15 +257,15 @@ class Player(PhysicsEntity):
                 self.game.screen_shake = max(16, self.game.screen_shake)
             self.game.dead += 1
 
-        if self.collisions["down"]:
+        if self.collisions & COLLIDE_DOWN:
             self.air_time = 0
             self.jumps = 1
 
         self.wall_slide = False
-        if (self.collisions["left"] or self.collisions["right"]) and self.air_time > 4:
+        if self.collisions & (COLLIDE_LEFT | COLLIDE_RIGHT) and self.air_time > 4:
             self.wall_slide = True
             self.velocity[1] = min(0.5, self.velocity[1])
-            if self.collisions["right"]:
+            if self.collisions & COLLIDE_RIGHT:
                 self.flip = False
             else:
                 self.flip = True
@@ -262,30 +283,27 @@ class Player(PhysicsEntity):
             self.velocity[0] = abs(self.dashing) / self.dashing * 8
             if abs(self.dashing) == 51:
                 self.velocity[0] *= 0.1
-            p_velocity = [abs(self.dashing) / self.dashing * (random.random() * 3), 0]
-            self.game.particles.append(
-                Particle(
-                    self.game,
-                    "particle",
-                    self.rect().center,
-                    velocity=p_velocity,
-                    frame=random.randint(0, 7),
-                )
+            p_velocity = [
+                abs(self.dashing) / self.dashing * (self.game.rng.random() * 3),
+                0,
+            ]
+            self.game.particles.spawn(
+                "particle",
+                self.rect().center,
+                velocity=p_velocity,
+                frame=self.game.rng.randint(0, 7),
             )
 
         if abs(self.dashing) in {60, 50}:
             for i in range(20):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 0.5 + 0.5
+                angle = self.game.rng.random() * math.pi * 2
+                speed = self.game.rng.random() * 0.5 + 0.5
                 p_velocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-                self.game.particles.append(
-                    Particle(
-                        self.game,
-                        "particle",
-                        self.rect().center,
-                        velocity=p_velocity,
-                        frame=random.randint(0, 7),
-                    )
+                self.game.particles.spawn(
+                    "particle",
+                    self.rect().center,
+                    velocity=p_velocity,
+                    frame=self.game.rng.randint(0, 7),
                 )
 
         if self.dashing > 0:
@@ -298,9 +316,9 @@ class Player(PhysicsEntity):
         if self.velocity[0] < 0:
             self.velocity[0] = min(self.velocity[0] + 0.1, 0)
 
-    def render(self, surf: pygame.Surface, offset=(0, 0)):
+    def submit(self, queue, offset=(0, 0)):
         if abs(self.dashing) <= 50:
-            super().render(surf, offset=offset)
+            super().submit(queue, offset=offset)
 
     def jump(self):
         if self.wall_slide:
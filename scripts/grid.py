@@ -0,0 +1,120 @@
+from array import array
+
+# Chunks are CHUNK_SIZE x CHUNK_SIZE cells, so the chunk of a cell is found with a
+# shift and the index inside the chunk with a mask (this also works for negative cells)
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
+
+EMPTY = -1
+
+
+class Chunk:
+    def __init__(self):
+        # Type ids index into the palette owned by the TileMap, EMPTY means no tile
+        self.types = array("b", [EMPTY]) * CHUNK_AREA
+        self.variants = array("B", [0]) * CHUNK_AREA
+        self.count = 0
+
+
+class ChunkGrid:
+    def __init__(self):
+        self.chunks = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.chunks = {}
+        self.count = 0
+
+    def type_at(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return EMPTY
+        return chunk.types[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    def get(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            return None
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        type_id = chunk.types[index]
+        if type_id == EMPTY:
+            return None
+        return type_id, chunk.variants[index]
+
+    def set(self, x, y, type_id, variant):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = Chunk()
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if chunk.types[index] == EMPTY:
+            chunk.count += 1
+            self.count += 1
+        chunk.types[index] = type_id
+        chunk.variants[index] = variant
+
+    def set_variant(self, x, y, variant):
+        chunk = self.chunks[(x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)]
+        chunk.variants[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)] = variant
+
+    def remove(self, x, y):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return False
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        if chunk.types[index] == EMPTY:
+            return False
+        chunk.types[index] = EMPTY
+        chunk.variants[index] = 0
+        chunk.count -= 1
+        self.count -= 1
+        if not chunk.count:
+            del self.chunks[key]
+        return True
+
+    def load_chunk(self, key, types, variants):
+        # Replaces a whole chunk from raw bytes, EMPTY cells are 0xFF in 'types'
+        self.unload_chunk(key)
+        chunk = Chunk()
+        chunk.types = array("b", types)
+        chunk.variants = array("B", variants)
+        chunk.count = CHUNK_AREA - chunk.types.count(EMPTY)
+        if chunk.count:
+            self.chunks[key] = chunk
+            self.count += chunk.count
+
+    def unload_chunk(self, key):
+        chunk = self.chunks.pop(key, None)
+        if chunk is None:
+            return False
+        self.count -= chunk.count
+        return True
+
+    def chunk_cells(self, key):
+        # Yields (x, y, type_id, variant) for every tile in one chunk, row by row
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return
+        base_x = key[0] << CHUNK_SHIFT
+        base_y = key[1] << CHUNK_SHIFT
+        types = chunk.types
+        variants = chunk.variants
+        for index in range(CHUNK_AREA):
+            type_id = types[index]
+            if type_id != EMPTY:
+                yield (
+                    base_x + (index & CHUNK_MASK),
+                    base_y + (index >> CHUNK_SHIFT),
+                    type_id,
+                    variants[index],
+                )
+
+    def cells(self):
+        for key in list(self.chunks):
+            yield from self.chunk_cells(key)
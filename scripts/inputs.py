@@ -0,0 +1,6 @@
+# The input for one simulation step packed into an int: the held directions plus
+# the buttons that were pressed since the previous step
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_DASH = 8
@@ -0,0 +1,104 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game import Game
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from scripts.mapfile import MAP_EXTENSION, PAGED_EXTENSION
+from scripts.tilemap import TileMap
+
+MAP_PRIORITY = {".json": 0, MAP_EXTENSION: 1, PAGED_EXTENSION: 2}
+
+
+class Level:
+    __slots__ = ("map_id", "tile_map", "player_pos", "enemy_positions", "leaf_spawners")
+
+    def __init__(self, game: Game, map_id, path):
+        # Everything Game.load_level needs, prepared without touching the game so it
+        # can run on the loader thread. The tile map doesn't change while a level
+        # is played, so a respawn reuses it as it is.
+        self.map_id = map_id
+        self.tile_map = TileMap(game, tile_size=16)
+        self.tile_map.load(path)
+
+        self.leaf_spawners = []
+        for tree in self.tile_map.extract([("large_decor", 2)], keep=True):
+            self.leaf_spawners.append(
+                pygame.Rect(4 + tree["pos"][0], 4 + tree["pos"][1], 23, 13)
+            )
+
+        self.player_pos = None
+        self.enemy_positions = []
+        for spawner in self.tile_map.extract([("spawners", 0), ("spawners", 1)]):
+            if spawner["variant"] == 0:
+                self.player_pos = spawner["pos"]
+            else:
+                self.enemy_positions.append(spawner["pos"])
+
+
+class LevelManager:
+    def __init__(self, game: Game, maps_path, cache_size=3):
+        # The maps directory is listed once, the maps are "<id>.json" files, binary
+        # "<id>.bin" ones or paged "<id>.pmap" ones. When a level has more than one
+        # the paged map wins, then the binary one.
+        self.game = game
+        self.paths = {}
+        priorities = {}
+        for name in os.listdir(maps_path):
+            stem, ext = os.path.splitext(name)
+            if ext not in MAP_PRIORITY or not stem.isdigit():
+                continue
+            if MAP_PRIORITY[ext] < priorities.get(int(stem), -1):
+                continue
+            priorities[int(stem)] = MAP_PRIORITY[ext]
+            self.paths[int(stem)] = os.path.join(maps_path, name)
+        self.ids = sorted(self.paths)
+
+        # The most recently used levels, and the ones being loaded in the background
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def last_level(self):
+        return self.ids[-1]
+
+    def get(self, map_id):
+        # The level from the cache, from the loader thread (waiting for it if it's
+        # still busy) or else loaded right here
+        with self.lock:
+            level = self.cache.get(map_id)
+            if level is not None:
+                self.cache.move_to_end(map_id)
+                return level
+            future = self.pending.pop(map_id, None)
+        level = future.result() if future is not None else self.load(map_id)
+        with self.lock:
+            self.cache[map_id] = level
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return level
+
+    def prefetch(self, map_id):
+        # Starts loading a level in the background, so get() finds it ready later
+        if map_id not in self.paths:
+            return
+        with self.lock:
+            if map_id in self.cache or map_id in self.pending:
+                return
+            self.pending[map_id] = self.executor.submit(self.load, map_id)
+
+    def load(self, map_id):
+        return Level(self.game, map_id, self.paths[map_id])
@@ -0,0 +1,376 @@
+# Compact binary map format, next to the JSON one used by data/maps and the editor.
+# Convert between them with: python -m scripts.mapfile IN OUT
+# (the output format is picked from the extension: .json, .pmap for the chunk-paged
+# variant, anything else for the flat binary format)
+import argparse
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+
+from scripts.grid import CHUNK_AREA, CHUNK_MASK, CHUNK_SHIFT
+
+MAP_MAGIC = b"NJMP"
+MAP_VERSION = 1
+MAP_EXTENSION = ".bin"
+# The body after the palette is zlib compressed
+FLAG_COMPRESSED = 1
+# Magic, version, flags, tile size, palette size, on-grid and off-grid tile counts.
+# The palette follows as length-prefixed UTF-8 type names, then the body: the
+# on-grid tiles as int32 x, int32 y, uint16 type and uint16 variant arrays, then
+# the off-grid tiles as float64 x, float64 y, uint16 type and uint16 variant arrays.
+MAP_HEADER = struct.Struct("<4sBBHHII")
+
+# Chunk-paged variant, for maps too big to load at once (see TileMap.open_paged)
+PAGED_MAGIC = b"NJPM"
+PAGED_VERSION = 1
+PAGED_EXTENSION = ".pmap"
+# Type id of an empty cell in a paged chunk
+PAGED_EMPTY = 0xFF
+# Magic, version, flags, tile size, palette size, chunk count, off-grid tile count
+# and the byte size of the off-grid block. Then the palette, one CHUNK_ENTRY per
+# chunk, the off-grid block (the same columns as in the flat format) and the chunks.
+PAGED_HEADER = struct.Struct("<4sBBHHIII")
+# Chunk x, chunk y, and the offset and byte size of the chunk in the file
+CHUNK_ENTRY = struct.Struct("<iiQI")
+
+
+class MapData:
+    __slots__ = ("tile_size", "types", "xs", "ys", "type_ids", "variants", "off_grid")
+
+    def __init__(self, tile_size=16):
+        # The on-grid tiles are parallel arrays, 'type_ids' index into 'types'.
+        # The off-grid tiles are kept as the dicts TileMap uses.
+        self.tile_size = tile_size
+        self.types = []
+        self.xs = array("i")
+        self.ys = array("i")
+        self.type_ids = array("H")
+        self.variants = array("H")
+        self.off_grid = []
+
+    def __len__(self):
+        return len(self.xs)
+
+    def type_id(self, tile_type, ids):
+        if tile_type not in ids:
+            ids[tile_type] = len(self.types)
+            self.types.append(tile_type)
+        return ids[tile_type]
+
+    @classmethod
+    def from_json(cls, data):
+        map_data = cls(data["tile_size"])
+        ids = {}
+        for tile in data["tilemap"].values():
+            map_data.xs.append(tile["pos"][0])
+            map_data.ys.append(tile["pos"][1])
+            map_data.type_ids.append(map_data.type_id(tile["type"], ids))
+            map_data.variants.append(tile["variant"])
+        map_data.off_grid = data["offgrid"]
+        for tile in map_data.off_grid:
+            map_data.type_id(tile["type"], ids)
+        return map_data
+
+    def to_json(self):
+        tile_map = {}
+        for x, y, type_id, variant in zip(
+            self.xs, self.ys, self.type_ids, self.variants
+        ):
+            tile_map[str(x) + ";" + str(y)] = {
+                "type": self.types[type_id],
+                "variant": variant,
+                "pos": [x, y],
+            }
+        return {
+            "tilemap": tile_map,
+            "tile_size": self.tile_size,
+            "offgrid": self.off_grid,
+        }
+
+
+def is_binary_map(raw):
+    return raw[: len(MAP_MAGIC)] == MAP_MAGIC
+
+
+def is_paged_map(raw):
+    return raw[: len(PAGED_MAGIC)] == PAGED_MAGIC
+
+
+def pack_columns(columns):
+    # Arrays are stored little-endian, whatever the machine
+    if sys.byteorder == "big":
+        columns = [array(column.typecode, column) for column in columns]
+        for column in columns:
+            column.byteswap()
+    return b"".join(column.tobytes() for column in columns)
+
+
+def unpack_columns(body, columns, offset=0):
+    # Fills every (array, count) from 'body', returns the offset after them
+    for column, count in columns:
+        size = count * column.itemsize
+        if offset + size > len(body):
+            raise ValueError("Truncated map file")
+        column.frombytes(body[offset : offset + size])
+        if sys.byteorder == "big":
+            column.byteswap()
+        offset += size
+    return offset
+
+
+def pack_palette(types):
+    palette = b""
+    for tile_type in types:
+        name = tile_type.encode()
+        palette += struct.pack("<B", len(name)) + name
+    return palette
+
+
+def unpack_palette(raw, count, offset):
+    types = []
+    for _ in range(count):
+        size = raw[offset]
+        types.append(bytes(raw[offset + 1 : offset + 1 + size]).decode())
+        offset += 1 + size
+    return types, offset
+
+
+def off_grid_columns(map_data):
+    ids = {tile_type: i for i, tile_type in enumerate(map_data.types)}
+    return [
+        array("d", [tile["pos"][0] for tile in map_data.off_grid]),
+        array("d", [tile["pos"][1] for tile in map_data.off_grid]),
+        array("H", [ids[tile["type"]] for tile in map_data.off_grid]),
+        array("H", [tile["variant"] for tile in map_data.off_grid]),
+    ]
+
+
+def unpack_off_grid(body, count, types, offset=0):
+    columns = [array("d"), array("d"), array("H"), array("H")]
+    offset = unpack_columns(body, [(column, count) for column in columns], offset)
+    off_grid = [
+        {"type": types[type_id], "variant": variant, "pos": [x, y]}
+        for x, y, type_id, variant in zip(*columns)
+    ]
+    return off_grid, offset
+
+
+def encode_map(map_data, compress=True):
+    body = pack_columns(
+        [map_data.xs, map_data.ys, map_data.type_ids, map_data.variants]
+        + off_grid_columns(map_data)
+    )
+    if compress:
+        body = zlib.compress(body)
+    header = MAP_HEADER.pack(
+        MAP_MAGIC,
+        MAP_VERSION,
+        FLAG_COMPRESSED if compress else 0,
+        map_data.tile_size,
+        len(map_data.types),
+        len(map_data.xs),
+        len(map_data.off_grid),
+    )
+    return header + pack_palette(map_data.types) + body
+
+
+def decode_map(raw):
+    if len(raw) < MAP_HEADER.size:
+        raise ValueError("Truncated map file")
+    magic, version, flags, tile_size, type_count, on_grid, off_grid = (
+        MAP_HEADER.unpack_from(raw)
+    )
+    if magic != MAP_MAGIC:
+        raise ValueError("Not a binary map file")
+    if version != MAP_VERSION:
+        raise ValueError(f"Unsupported map version {version}")
+
+    map_data = MapData(tile_size)
+    map_data.types, offset = unpack_palette(raw, type_count, MAP_HEADER.size)
+    body = raw[offset:]
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    offset = unpack_columns(
+        body,
+        [
+            (map_data.xs, on_grid),
+            (map_data.ys, on_grid),
+            (map_data.type_ids, on_grid),
+            (map_data.variants, on_grid),
+        ],
+    )
+    map_data.off_grid, offset = unpack_off_grid(body, off_grid, map_data.types, offset)
+    return map_data
+
+
+def encode_paged_map(map_data, compress=True):
+    # The on-grid tiles are split into grid chunks stored one after the other, so
+    # PagedMap can read any chunk on its own. A chunk is its CHUNK_AREA type ids
+    # (PAGED_EMPTY for no tile) followed by its CHUNK_AREA variants, row by row.
+    if len(map_data.types) >= PAGED_EMPTY:
+        raise ValueError("Too many tile types for a paged map")
+    chunks = {}
+    for x, y, type_id, variant in zip(
+        map_data.xs, map_data.ys, map_data.type_ids, map_data.variants
+    ):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        chunk = chunks.get(key)
+        if chunk is None:
+            chunk = chunks[key] = bytearray([PAGED_EMPTY]) * CHUNK_AREA + bytearray(
+                CHUNK_AREA
+            )
+        index = ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+        chunk[index] = type_id
+        chunk[CHUNK_AREA + index] = variant
+
+    off_grid = pack_columns(off_grid_columns(map_data))
+    blobs = []
+    for key in sorted(chunks):
+        blob = bytes(chunks[key])
+        blobs.append(zlib.compress(blob) if compress else blob)
+    if compress:
+        off_grid = zlib.compress(off_grid)
+
+    header = PAGED_HEADER.pack(
+        PAGED_MAGIC,
+        PAGED_VERSION,
+        FLAG_COMPRESSED if compress else 0,
+        map_data.tile_size,
+        len(map_data.types),
+        len(chunks),
+        len(map_data.off_grid),
+        len(off_grid),
+    )
+    palette = pack_palette(map_data.types)
+    offset = len(header) + len(palette) + CHUNK_ENTRY.size * len(chunks) + len(off_grid)
+    index = b""
+    for key, blob in zip(sorted(chunks), blobs):
+        index += CHUNK_ENTRY.pack(key[0], key[1], offset, len(blob))
+        offset += len(blob)
+    return header + palette + index + off_grid + b"".join(blobs)
+
+
+class PagedMap:
+    def __init__(self, filename):
+        # Only the header, the palette, the chunk index and the off-grid tiles are
+        # read up front, the chunks are read from the memory-mapped file on demand
+        self.file = open(filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < PAGED_HEADER.size:
+            self.close()
+            raise ValueError("Truncated map file")
+        (
+            magic,
+            version,
+            self.flags,
+            self.tile_size,
+            type_count,
+            chunk_count,
+            off_grid_count,
+            off_grid_size,
+        ) = PAGED_HEADER.unpack_from(self.data)
+        if magic != PAGED_MAGIC:
+            self.close()
+            raise ValueError("Not a paged map file")
+        if version != PAGED_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported paged map version {version}")
+
+        self.types, offset = unpack_palette(self.data, type_count, PAGED_HEADER.size)
+        self.index = {}
+        for _ in range(chunk_count):
+            chunk_x, chunk_y, chunk_offset, size = CHUNK_ENTRY.unpack_from(
+                self.data, offset
+            )
+            self.index[(chunk_x, chunk_y)] = (chunk_offset, size)
+            offset += CHUNK_ENTRY.size
+        off_grid = self.data[offset : offset + off_grid_size]
+        if self.flags & FLAG_COMPRESSED:
+            off_grid = zlib.decompress(off_grid)
+        self.off_grid, _ = unpack_off_grid(off_grid, off_grid_count, self.types)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def chunk(self, key):
+        # (type ids, variants) of a chunk as bytes, or None if it has no tiles
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        offset, size = entry
+        blob = self.data[offset : offset + size]
+        if self.flags & FLAG_COMPRESSED:
+            blob = zlib.decompress(blob)
+        return blob[:CHUNK_AREA], blob[CHUNK_AREA:]
+
+    def to_map_data(self):
+        # The whole map at once, for converting it to the other formats
+        map_data = MapData(self.tile_size)
+        map_data.types = list(self.types)
+        for key in sorted(self.index):
+            types, variants = self.chunk(key)
+            for index in range(CHUNK_AREA):
+                if types[index] != PAGED_EMPTY:
+                    map_data.xs.append((key[0] << CHUNK_SHIFT) + (index & CHUNK_MASK))
+                    map_data.ys.append((key[1] << CHUNK_SHIFT) + (index >> CHUNK_SHIFT))
+                    map_data.type_ids.append(types[index])
+                    map_data.variants.append(variants[index])
+        map_data.off_grid = self.off_grid
+        return map_data
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def read_map(filename):
+    # Any format, told apart by the magic at the start of binary maps
+    with open(filename, "rb") as f:
+        raw = f.read()
+    if is_binary_map(raw):
+        return decode_map(raw)
+    if is_paged_map(raw):
+        paged_map = PagedMap(filename)
+        try:
+            return paged_map.to_map_data()
+        finally:
+            paged_map.close()
+    return MapData.from_json(json.loads(raw))
+
+
+def write_map(filename, map_data, compress=True):
+    if str(filename).endswith(".json"):
+        with open(filename, "w") as f:
+            json.dump(map_data.to_json(), f)
+    elif str(filename).endswith(PAGED_EXTENSION):
+        with open(filename, "wb") as f:
+            f.write(encode_paged_map(map_data, compress=compress))
+    else:
+        with open(filename, "wb") as f:
+            f.write(encode_map(map_data, compress=compress))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert a map between the JSON and the binary formats."
+    )
+    parser.add_argument("input")
+    parser.add_argument(
+        "output", help="a .json or .pmap file, or anything else for flat binary"
+    )
+    parser.add_argument(
+        "--no-compress", action="store_true", help="don't compress binary output"
+    )
+    args = parser.parse_args()
+    map_data = read_map(args.input)
+    write_map(args.output, map_data, compress=not args.no_compress)
+    print(
+        f"{args.input} -> {args.output}: "
+        f"{len(map_data)} tiles, {len(map_data.off_grid)} off-grid tiles"
+    )
@@ -0,0 +1,40 @@
+import pygame
+
+OUTLINE_MODES = {"alpha", "mask", "off"}
+OUTLINE_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+OUTLINE_COLOR = (0, 0, 0, 180)
+
+
+class OutlineRenderer:
+    def __init__(self, size, mode="alpha"):
+        if mode not in OUTLINE_MODES:
+            raise ValueError(f"Unknown outline mode: {mode}")
+        self.mode = mode
+        # Reused every frame, only the part covered by the current frame is valid
+        self.silhouette = pygame.Surface(size, pygame.SRCALPHA)
+
+    def render(self, source: pygame.Surface, dest: pygame.Surface):
+        if self.mode == "mask":
+            # Original approach, a new mask per frame but the silhouette surface is reused
+            pygame.mask.from_surface(source).to_surface(
+                self.silhouette, setcolor=OUTLINE_COLOR, unsetcolor=(0, 0, 0, 0)
+            )
+            area = self.silhouette.get_rect()
+        elif self.mode == "alpha":
+            # Works straight from the alpha channel and only on the area that has something drawn,
+            # the silhouette is a copy of the source multiplied down to the outline color
+            area = source.get_bounding_rect()
+            if not area.width or not area.height:
+                return
+            self.silhouette.fill((0, 0, 0, 0), area)
+            self.silhouette.blit(
+                source, area, area, special_flags=pygame.BLEND_RGBA_ADD
+            )
+            self.silhouette.fill(
+                OUTLINE_COLOR, area, special_flags=pygame.BLEND_RGBA_MULT
+            )
+        else:
+            return
+
+        for offset in OUTLINE_OFFSETS:
+            dest.blit(self.silhouette, (area.x + offset[0], area.y + offset[1]), area)
@@ -1,39 +1,158 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 
-
 if TYPE_CHECKING:
     from game import Game
 
+import math
+
+from scripts.pool import Pool
+from scripts.renderer import LAYER_PARTICLES
+
+# Particle types that drift sideways while falling
+SWAY_TYPES = {"leaf"}
 
-class Particle:
-    def __init__(self, game: Game, p_type, pos, velocity=[0, 0], frame=0):
+
+class ParticleSystem:
+    def __init__(self, game: Game, capacity=1024):
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets["particle/" + self.type].copy()
-        self.animation.frame = frame
 
-    def update(self):
-        kill = False
+        # Per particle type, looked up by a kind id: the (image, half width, half height,
+        # width, height) to draw for every animation frame, and the last frame of the
+        # animation
+        self.kind_ids = {}
+        self.kind_frames = []
+        self.kind_ends = []
+        self.kind_sway = []
+
+        # Every particle is one slot in these preallocated columns, when the pool is
+        # full the oldest particle makes room for the new one. 'sways' is the sideways
+        # drift of the last update, only added on the next one so the particle is
+        # drawn before it moves by it. 'prev_xs' and 'prev_ys' are the position before
+        # the last update, to draw the particle in between like the entities.
+        self.pool = Pool(
+            capacity,
+            {
+                "kinds": 0,
+                "xs": 0.0,
+                "ys": 0.0,
+                "vxs": 0.0,
+                "vys": 0.0,
+                "frames": 0,
+                "sways": 0.0,
+                "prev_xs": 0.0,
+                "prev_ys": 0.0,
+            },
+        )
+        self.kinds = self.pool.columns["kinds"]
+        self.xs = self.pool.columns["xs"]
+        self.ys = self.pool.columns["ys"]
+        self.vxs = self.pool.columns["vxs"]
+        self.vys = self.pool.columns["vys"]
+        self.frames = self.pool.columns["frames"]
+        self.sways = self.pool.columns["sways"]
+        self.prev_xs = self.pool.columns["prev_xs"]
+        self.prev_ys = self.pool.columns["prev_ys"]
 
-        if self.animation.done:
-            kill = True
+    def __len__(self):
+        return len(self.pool)
 
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+    def clear(self):
+        self.pool.clear()
 
-        self.animation.update()
+    def kind_id(self, p_type):
+        if p_type not in self.kind_ids:
+            animation = self.game.assets["particle/" + p_type]
+            end = len(animation.images) * animation.img_duration - 1
+            frames = []
+            for frame in range(end + 1):
+                img = animation.images[int(frame / animation.img_duration)]
+                width, height = img.get_size()
+                frames.append((img, width // 2, height // 2, width, height))
+            self.kind_ids[p_type] = len(self.kind_frames)
+            self.kind_frames.append(frames)
+            self.kind_ends.append(end)
+            self.kind_sway.append(p_type in SWAY_TYPES)
+        return self.kind_ids[p_type]
 
-        return kill
+    def spawn(self, p_type, pos, velocity=(0, 0), frame=0):
+        slot = self.pool.acquire()
+        self.kinds[slot] = self.kind_id(p_type)
+        self.xs[slot] = pos[0]
+        self.ys[slot] = pos[1]
+        self.vxs[slot] = velocity[0]
+        self.vys[slot] = velocity[1]
+        self.frames[slot] = frame
+        self.sways[slot] = 0.0
+        self.prev_xs[slot] = pos[0]
+        self.prev_ys[slot] = pos[1]
 
-    def render(self, surface, offset=(0, 0)):
-        img = self.animation.img()
-        surface.blit(
-            img,
-            (
-                self.pos[0] - offset[0] - img.get_width() // 2,
-                self.pos[1] - offset[1] - img.get_height() // 2,
-            ),
-        )
+    def update(self):
+        pool = self.pool
+        kinds = self.kinds
+        xs = self.xs
+        ys = self.ys
+        vxs = self.vxs
+        vys = self.vys
+        frames = self.frames
+        sways = self.sways
+        prev_xs = self.prev_xs
+        prev_ys = self.prev_ys
+        ends = self.kind_ends
+        sway = self.kind_sway
+        for i in range(pool.count):
+            slot = (pool.head + i) % pool.capacity
+            kind = kinds[slot]
+            frame = frames[slot]
+            # A particle is kept for one more update after its animation reaches the last
+            # frame, so the frame counter is allowed to go one past the end before it's released
+            if frame > ends[kind]:
+                pool.release(slot)
+                continue
+            frame += 1
+            frames[slot] = frame
+            prev_xs[slot] = xs[slot]
+            prev_ys[slot] = ys[slot]
+            ys[slot] += vys[slot]
+            if sway[kind]:
+                xs[slot] += sways[slot]
+                xs[slot] += vxs[slot]
+                sways[slot] = math.sin(min(frame, ends[kind]) * 0.035) * 0.3
+            else:
+                xs[slot] += vxs[slot]
+        pool.compact()
+
+    def blits(self, offset, size, alpha=1.0):
+        # The (img, pos) to draw for a view of 'size' at 'offset', without the
+        # particles outside it. 'alpha' is how far to draw the particles between
+        # their previous and current positions, like Game.render does for the entities.
+        pool = self.pool
+        kind_frames = self.kind_frames
+        ends = self.kind_ends
+        xs = self.xs
+        ys = self.ys
+        prev_xs = self.prev_xs
+        prev_ys = self.prev_ys
+        behind = 1 - alpha
+        view_w, view_h = size
+        blits = []
+        for i in range(pool.count):
+            slot = (pool.head + i) % pool.capacity
+            kind = self.kinds[slot]
+            img, half_w, half_h, width, height = kind_frames[kind][
+                min(self.frames[slot], ends[kind])
+            ]
+            x = xs[slot]
+            y = ys[slot]
+            x = x - (x - prev_xs[slot]) * behind - offset[0] - half_w
+            y = y - (y - prev_ys[slot]) * behind - offset[1] - half_h
+            if x >= view_w or y >= view_h or x + width <= 0 or y + height <= 0:
+                continue
+            blits.append((img, (x, y)))
+        return blits
+
+    def render(self, surface, offset=(0, 0), alpha=1.0):
+        surface.fblits(self.blits(offset, surface.get_size(), alpha))
+
+    def submit(self, queue, offset=(0, 0), alpha=1.0):
+        queue.extend(self.blits(offset, queue.size, alpha), LAYER_PARTICLES)
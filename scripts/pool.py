@@ -0,0 +1,62 @@
+class Pool:
+    def __init__(self, capacity, columns):
+        # Preallocated storage for up to 'capacity' items, one list per column
+        # ({name: default value}). Live items sit in a ring buffer starting at 'head'
+        # in the order they were acquired, so the oldest one is always at 'head'.
+        self.capacity = capacity
+        self.columns = {name: [default] * capacity for name, default in columns.items()}
+        self.alive = [False] * capacity
+        self.head = 0
+        self.count = 0
+        self.released = 0
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        for slot in range(self.capacity):
+            self.alive[slot] = False
+        self.head = 0
+        self.count = 0
+        self.released = 0
+
+    def acquire(self):
+        # When the pool is full the oldest item is evicted and its slot reused
+        if self.count == self.capacity:
+            slot = self.head
+            self.head = (self.head + 1) % self.capacity
+            if not self.alive[slot]:
+                self.released -= 1
+        else:
+            slot = (self.head + self.count) % self.capacity
+            self.count += 1
+        self.alive[slot] = True
+        return slot
+
+    def release(self, slot):
+        # The slot stays in place until the next compact()
+        if self.alive[slot]:
+            self.alive[slot] = False
+            self.released += 1
+
+    def compact(self):
+        # Moves the live items together, keeping their order, without allocating
+        if not self.released:
+            return
+        capacity = self.capacity
+        alive = self.alive
+        columns = list(self.columns.values())
+        write = 0
+        for i in range(self.count):
+            slot = (self.head + i) % capacity
+            if not alive[slot]:
+                continue
+            if write != i:
+                target = (self.head + write) % capacity
+                for column in columns:
+                    column[target] = column[slot]
+                alive[target] = True
+                alive[slot] = False
+            write += 1
+        self.count = write
+        self.released = 0
@@ -0,0 +1,40 @@
+import pygame
+
+
+class Presenter:
+    def __init__(
+        self, screen: pygame.Surface, source: pygame.Surface, integer_scaling=False
+    ):
+        # Scales the internal rendering surface ('source') up to the window. The
+        # scaled frame goes into a surface allocated once here instead of a new one
+        # every frame. With 'integer_scaling' the frame is only scaled by whole
+        # numbers (crisp pixels) and centered, with black bars around it.
+        self.screen = screen
+        self.integer_scaling = integer_scaling
+        screen_w, screen_h = screen.get_size()
+        source_w, source_h = self.source_size = source.get_size()
+        if integer_scaling:
+            scale = max(1, min(screen_w // source_w, screen_h // source_h))
+            size = (source_w * scale, source_h * scale)
+        else:
+            size = (screen_w, screen_h)
+        self.rect = pygame.Rect(
+            ((screen_w - size[0]) // 2, (screen_h - size[1]) // 2), size
+        )
+        # transform.scale wants a destination with the same pixel format as the source
+        self.scaled = pygame.Surface(size, 0, source)
+
+    def present(self, source: pygame.Surface, offset=(0, 0)):
+        pygame.transform.scale(source, self.rect.size, self.scaled)
+        if self.rect.topleft != (0, 0):
+            self.screen.fill((0, 0, 0))
+        self.screen.blit(
+            self.scaled, (self.rect.x + offset[0], self.rect.y + offset[1])
+        )
+
+    def to_source(self, pos):
+        # Window coordinates (e.g. the mouse) to coordinates on the source surface
+        return (
+            (pos[0] - self.rect.x) * self.source_size[0] / self.rect.width,
+            (pos[1] - self.rect.y) * self.source_size[1] / self.rect.height,
+        )
@@ -0,0 +1,119 @@
+import csv
+import json
+import time
+from collections import deque
+
+import pygame
+
+PERCENTILES = (50, 95, 99)
+
+
+class ProfileScope:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    def __init__(self, history=600):
+        # The last 'history' frames are kept for every phase, in milliseconds.
+        # A phase that runs more than once in a frame (e.g. several simulation
+        # steps) is summed up into a single sample for that frame.
+        self.history = history
+        self.samples = {}
+        self.frame_times = {}
+        self.scopes = {}
+        self.font = None
+
+    def scope(self, name):
+        # Scopes are reused, so timing a phase doesn't allocate anything
+        scope = self.scopes.get(name)
+        if scope is None:
+            scope = self.scopes[name] = ProfileScope(self, name)
+        return scope
+
+    def add(self, name, seconds):
+        self.frame_times[name] = self.frame_times.get(name, 0.0) + seconds
+
+    def end_frame(self):
+        for name, seconds in self.frame_times.items():
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.history)
+            self.samples[name].append(seconds * 1000)
+        self.frame_times.clear()
+
+    def stats(self):
+        stats = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            phase = {
+                "count": len(ordered),
+                "mean": sum(ordered) / len(ordered),
+                "max": ordered[-1],
+            }
+            for percentile in PERCENTILES:
+                # Nearest-rank percentile
+                index = max(0, -(-percentile * len(ordered) // 100) - 1)
+                phase[f"p{percentile}"] = ordered[index]
+            stats[name] = phase
+        return stats
+
+    def export(self, path):
+        # The format is picked from the extension: .csv for a table of the stats,
+        # anything else for JSON with the stats and the raw samples
+        stats = self.stats()
+        if str(path).endswith(".csv"):
+            fields = ["count", "mean"] + [f"p{p}" for p in PERCENTILES] + ["max"]
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["phase"] + fields)
+                for name, phase in stats.items():
+                    writer.writerow(
+                        [name] + [round(phase[field], 4) for field in fields]
+                    )
+        else:
+            with open(path, "w") as f:
+                json.dump(
+                    {
+                        name: dict(phase, samples=list(self.samples[name]))
+                        for name, phase in stats.items()
+                    },
+                    f,
+                    indent=2,
+                )
+
+    def render(self, surf: pygame.Surface, pos=(4, 4)):
+        if self.font is None:
+            self.font = pygame.font.Font(None, 18)
+        # The default font isn't monospaced, so every column is drawn on its own
+        columns = (0, 130, 180, 230)
+        rows = [("ms", "p50", "p95", "p99")]
+        for name, phase in sorted(self.stats().items()):
+            rows.append(
+                (
+                    name,
+                    f"{phase['p50']:.2f}",
+                    f"{phase['p95']:.2f}",
+                    f"{phase['p99']:.2f}",
+                )
+            )
+        line_size = self.font.get_linesize()
+        backdrop = pygame.Surface((280, len(rows) * line_size + 4), pygame.SRCALPHA)
+        backdrop.fill((0, 0, 0, 160))
+        surf.blit(backdrop, pos)
+        for i, row in enumerate(rows):
+            for x, text in zip(columns, row):
+                surf.blit(
+                    self.font.render(text, True, (255, 255, 255)),
+                    (pos[0] + 4 + x, pos[1] + 2 + i * line_size),
+                )
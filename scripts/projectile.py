@@ -0,0 +1,142 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game import Game
+    from scripts.tilemap import TileMap
+
+from scripts.pool import Pool
+from scripts.renderer import LAYER_PROJECTILES
+
+# Frames a projectile lives before it disappears on its own
+PROJECTILE_LIFETIME = 360
+
+
+class ProjectileSystem:
+    def __init__(self, game: Game, capacity=512):
+        self.game = game
+        # Every projectile is one slot in these preallocated columns, when the pool
+        # is full the oldest projectile makes room for the new one. 'prev_xs' and
+        # 'prev_ys' are the position before the last update, to draw the projectile
+        # in between like the entities.
+        self.pool = Pool(
+            capacity,
+            {
+                "xs": 0.0,
+                "ys": 0.0,
+                "vxs": 0.0,
+                "vys": 0.0,
+                "timers": 0,
+                "prev_xs": 0.0,
+                "prev_ys": 0.0,
+            },
+        )
+        self.xs = self.pool.columns["xs"]
+        self.ys = self.pool.columns["ys"]
+        self.vxs = self.pool.columns["vxs"]
+        self.vys = self.pool.columns["vys"]
+        self.timers = self.pool.columns["timers"]
+        self.prev_xs = self.pool.columns["prev_xs"]
+        self.prev_ys = self.pool.columns["prev_ys"]
+
+    def __len__(self):
+        return len(self.pool)
+
+    def clear(self):
+        self.pool.clear()
+
+    def spawn(self, pos, velocity):
+        slot = self.pool.acquire()
+        self.xs[slot] = pos[0]
+        self.ys[slot] = pos[1]
+        self.vxs[slot] = velocity[0]
+        self.vys[slot] = velocity[1]
+        self.timers[slot] = 0
+        self.prev_xs[slot] = pos[0]
+        self.prev_ys[slot] = pos[1]
+
+    def update(self, tile_map: TileMap):
+        # Moves every projectile and removes the ones that hit a wall or expired.
+        # Returns the wall hits as (x, y, vx, vy) so the caller can add effects.
+        pool = self.pool
+        xs = self.xs
+        ys = self.ys
+        vxs = self.vxs
+        vys = self.vys
+        timers = self.timers
+        tile_size = tile_map.tile_size
+        hits = []
+        for i in range(pool.count):
+            slot = (pool.head + i) % pool.capacity
+            x = xs[slot]
+            y = ys[slot]
+            self.prev_xs[slot] = x
+            self.prev_ys[slot] = y
+            new_x = x + vxs[slot]
+            new_y = y + vys[slot]
+            # The segment only has to be checked when the projectile changes cells
+            # (or was just spawned, since the cell it starts in could be solid)
+            if (
+                not timers[slot]
+                or int(x // tile_size) != int(new_x // tile_size)
+                or int(y // tile_size) != int(new_y // tile_size)
+            ):
+                hit = tile_map.segment_hit((x, y), (new_x, new_y))
+                if hit is not None:
+                    hits.append((hit[0], hit[1], vxs[slot], vys[slot]))
+                    pool.release(slot)
+                    continue
+            xs[slot] = new_x
+            ys[slot] = new_y
+            timers[slot] += 1
+            if timers[slot] > PROJECTILE_LIFETIME:
+                pool.release(slot)
+        pool.compact()
+        return hits
+
+    def collide_rect(self, rect, slots=None):
+        # Removes the projectiles inside the rect and returns their positions. Only
+        # 'slots' are checked when given, e.g. candidates from a BroadPhase.
+        pool = self.pool
+        if slots is None:
+            slots = [(pool.head + i) % pool.capacity for i in range(pool.count)]
+        hits = []
+        for slot in slots:
+            if pool.alive[slot] and rect.collidepoint(self.xs[slot], self.ys[slot]):
+                hits.append((self.xs[slot], self.ys[slot]))
+                pool.release(slot)
+        pool.compact()
+        return hits
+
+    def blits(self, offset, size, alpha=1.0):
+        # The (img, pos) to draw for a view of 'size' at 'offset', without the
+        # projectiles outside it. 'alpha' is how far to draw the projectiles between
+        # their previous and current positions, like Game.render does for the entities.
+        pool = self.pool
+        img = self.game.assets["projectile"]
+        width, height = img.get_size()
+        half_w = width / 2
+        half_h = height / 2
+        view_w, view_h = size
+        xs = self.xs
+        ys = self.ys
+        prev_xs = self.prev_xs
+        prev_ys = self.prev_ys
+        behind = 1 - alpha
+        blits = []
+        for i in range(pool.count):
+            slot = (pool.head + i) % pool.capacity
+            x = xs[slot]
+            y = ys[slot]
+            x = x - (x - prev_xs[slot]) * behind - half_w - offset[0]
+            y = y - (y - prev_ys[slot]) * behind - half_h - offset[1]
+            if x >= view_w or y >= view_h or x + width <= 0 or y + height <= 0:
+                continue
+            blits.append((img, (x, y)))
+        return blits
+
+    def render(self, surf, offset=(0, 0), alpha=1.0):
+        surf.fblits(self.blits(offset, surf.get_size(), alpha))
+
+    def submit(self, queue, offset=(0, 0), alpha=1.0):
+        queue.extend(self.blits(offset, queue.size, alpha), LAYER_PROJECTILES)
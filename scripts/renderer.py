@@ -0,0 +1,51 @@
+# Draw layers, lower layers are drawn first and within a layer the commands are
+# drawn in the order they were submitted
+LAYER_BACKGROUND = 0
+LAYER_CLOUDS = 10
+LAYER_TILES = 20
+LAYER_ENTITIES = 30
+LAYER_PROJECTILES = 40
+LAYER_PARTICLES = 50
+
+
+class RenderQueue:
+    def __init__(self, size):
+        # Blit commands for one target surface of 'size', collected from all the
+        # subsystems and drawn with one fblits call per layer
+        self.size = size
+        self.layers = {}
+
+    def __len__(self):
+        return sum(len(commands) for commands in self.layers.values())
+
+    def clear(self):
+        self.layers.clear()
+
+    def submit(self, img, pos, layer):
+        # Commands that end up completely outside the target are dropped here
+        if (
+            pos[0] >= self.size[0]
+            or pos[1] >= self.size[1]
+            or pos[0] + img.get_width() <= 0
+            or pos[1] + img.get_height() <= 0
+        ):
+            return
+        commands = self.layers.get(layer)
+        if commands is None:
+            commands = self.layers[layer] = []
+        commands.append((img, pos))
+
+    def extend(self, blits, layer):
+        # A batch of (img, pos) commands, culled by the caller against 'size' (see
+        # the blits methods of TileMap, ParticleSystem and ProjectileSystem)
+        commands = self.layers.get(layer)
+        if commands is None:
+            commands = self.layers[layer] = []
+        commands.extend(blits)
+
+    def flush(self, surf, until=None):
+        # Draws the layers below 'until' (all of them by default) and drops them
+        for layer in sorted(self.layers):
+            if until is not None and layer >= until:
+                break
+            surf.fblits(self.layers.pop(layer))
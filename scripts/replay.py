@@ -0,0 +1,53 @@
+import struct
+import zlib
+
+# A replay file is a fixed header followed by the zlib compressed inputs, one
+# byte of INPUT_* flags per simulation step
+REPLAY_MAGIC = b"NJRP"
+# Version 2: dash kills are resolved after all the enemies moved (broad phase), so
+# version 1 recordings with kills would play back differently
+REPLAY_VERSION = 2
+REPLAY_HEADER = struct.Struct("<4sBQHI")
+# Seeds are stored as unsigned 64-bit integers
+MAX_SEED = 2**64 - 1
+
+
+class Replay:
+    def __init__(self, seed, level, inputs=b""):
+        # Replaying is only exact from a new Game created with the same seed and level
+        self.seed = seed
+        self.level = level
+        self.inputs = bytearray(inputs)
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def record(self, inputs):
+        self.inputs.append(inputs)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(
+                REPLAY_HEADER.pack(
+                    REPLAY_MAGIC,
+                    REPLAY_VERSION,
+                    self.seed,
+                    self.level,
+                    len(self.inputs),
+                )
+            )
+            f.write(zlib.compress(bytes(self.inputs)))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, seed, level, count = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC:
+            raise ValueError(f"{path} is not a replay file")
+        if version != REPLAY_VERSION:
+            raise ValueError(f"Unsupported replay version {version} in {path}")
+        inputs = zlib.decompress(data[REPLAY_HEADER.size :])
+        if len(inputs) != count:
+            raise ValueError(f"Replay {path} is truncated")
+        return cls(seed, level, inputs)
@@ -1,58 +1,102 @@
-from __future__ import annotations
-from typing import TYPE_CHECKING
+import math
+import pygame
 
+from scripts.pool import Pool
 
-if TYPE_CHECKING:
-    from game import Game
 
-import math
-import pygame
+class SparkSystem:
+    def __init__(self, capacity=512):
+        # Every spark is one slot in these preallocated columns, the direction is
+        # stored as a unit vector so no trig is needed after the spark is spawned.
+        # When the pool is full the oldest spark makes room for the new one.
+        # 'prev_xs' and 'prev_ys' are the position before the last update, to draw
+        # the spark in between like the entities.
+        self.pool = Pool(
+            capacity,
+            {
+                "xs": 0.0,
+                "ys": 0.0,
+                "dxs": 0.0,
+                "dys": 0.0,
+                "speeds": 0.0,
+                "prev_xs": 0.0,
+                "prev_ys": 0.0,
+            },
+        )
+        self.xs = self.pool.columns["xs"]
+        self.ys = self.pool.columns["ys"]
+        self.dxs = self.pool.columns["dxs"]
+        self.dys = self.pool.columns["dys"]
+        self.speeds = self.pool.columns["speeds"]
+        self.prev_xs = self.pool.columns["prev_xs"]
+        self.prev_ys = self.pool.columns["prev_ys"]
+
+    def __len__(self):
+        return len(self.pool)
 
+    def clear(self):
+        self.pool.clear()
 
-class Spark:
-    def __init__(self, pos, angle, speed):
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
+    def spawn(self, pos, angle, speed):
+        slot = self.pool.acquire()
+        self.xs[slot] = pos[0]
+        self.ys[slot] = pos[1]
+        self.dxs[slot] = math.cos(angle)
+        self.dys[slot] = math.sin(angle)
+        self.speeds[slot] = speed
+        self.prev_xs[slot] = pos[0]
+        self.prev_ys[slot] = pos[1]
 
     def update(self):
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
-
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed
-
-    def render(self, surface, offset=(0, 0)):
-        render_points = [
-            (
-                self.pos[0] + math.cos(self.angle) * self.speed * 3 - offset[0],
-                self.pos[1] + math.sin(self.angle) * self.speed * 3 - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle + math.pi * 0.5) * self.speed * 0.5
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle + math.pi * 0.5) * self.speed * 0.5
-                - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle + math.pi) * self.speed * 3
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle + math.pi) * self.speed * 3
-                - offset[1],
-            ),
-            (
-                self.pos[0]
-                + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5
-                - offset[0],
-                self.pos[1]
-                + math.sin(self.angle - math.pi * 0.5) * self.speed * 0.5
-                - offset[1],
-            ),
-        ]
-        pygame.draw.polygon(
-            surface=surface, color=(255, 255, 255), points=render_points
-        )
+        pool = self.pool
+        xs = self.xs
+        ys = self.ys
+        dxs = self.dxs
+        dys = self.dys
+        speeds = self.speeds
+        prev_xs = self.prev_xs
+        prev_ys = self.prev_ys
+        for i in range(pool.count):
+            slot = (pool.head + i) % pool.capacity
+            speed = speeds[slot]
+            # Sparks that ran out of speed were still drawn on their last frame, drop them now
+            if not speed:
+                pool.release(slot)
+                continue
+            prev_xs[slot] = xs[slot]
+            prev_ys[slot] = ys[slot]
+            xs[slot] += dxs[slot] * speed
+            ys[slot] += dys[slot] * speed
+            speeds[slot] = max(0, speed - 0.1)
+        pool.compact()
+
+    def render(self, surface, offset=(0, 0), alpha=1.0):
+        # A spark is a diamond, long along its direction and thin across it. It's
+        # drawn 'alpha' of the way between its previous and current positions.
+        pool = self.pool
+        draw_polygon = pygame.draw.polygon
+        xs = self.xs
+        ys = self.ys
+        prev_xs = self.prev_xs
+        prev_ys = self.prev_ys
+        behind = 1 - alpha
+        for i in range(pool.count):
+            slot = (pool.head + i) % pool.capacity
+            x = xs[slot]
+            y = ys[slot]
+            x = x - (x - prev_xs[slot]) * behind - offset[0]
+            y = y - (y - prev_ys[slot]) * behind - offset[1]
+            dx = self.dxs[slot]
+            dy = self.dys[slot]
+            length = self.speeds[slot] * 3
+            width = self.speeds[slot] * 0.5
+            draw_polygon(
+                surface,
+                (255, 255, 255),
+                [
+                    (x + dx * length, y + dy * length),
+                    (x - dy * width, y + dx * width),
+                    (x - dx * length, y - dy * length),
+                    (x + dy * width, y - dx * width),
+                ],
+            )
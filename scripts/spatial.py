@@ -0,0 +1,72 @@
+import pygame
+
+
+class SpatialHash:
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        # Every bucket maps item keys to entries, an entry being [item, rect, order].
+        # The order is used to return query results in insertion order.
+        self.buckets = {}
+        self.entries = {}
+        self.next_order = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.buckets = {}
+        self.entries = {}
+        self.next_order = 0
+
+    def cells(self, rect):
+        for x in range(
+            rect.left // self.cell_size, (rect.right - 1) // self.cell_size + 1
+        ):
+            for y in range(
+                rect.top // self.cell_size, (rect.bottom - 1) // self.cell_size + 1
+            ):
+                yield (x, y)
+
+    def insert(self, item, rect):
+        # Items are tracked by identity, so unhashable items like tile dicts work too
+        key = id(item)
+        if key in self.entries:
+            self.remove(item)
+        entry = [item, pygame.Rect(rect), self.next_order]
+        self.next_order += 1
+        self.entries[key] = entry
+        for cell in self.cells(entry[1]):
+            self.buckets.setdefault(cell, {})[key] = entry
+
+    def remove(self, item):
+        key = id(item)
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return False
+        for cell in self.cells(entry[1]):
+            bucket = self.buckets[cell]
+            del bucket[key]
+            if not bucket:
+                del self.buckets[cell]
+        return True
+
+    def query(self, rect):
+        rect = pygame.Rect(rect)
+        found = {}
+        for cell in self.cells(rect):
+            bucket = self.buckets.get(cell)
+            if bucket is None:
+                continue
+            for key, entry in bucket.items():
+                if key not in found and entry[1].colliderect(rect):
+                    found[key] = entry
+        return [entry[0] for entry in sorted(found.values(), key=lambda e: e[2])]
+
+    def query_point(self, pos):
+        bucket = self.buckets.get(
+            (int(pos[0] // self.cell_size), int(pos[1] // self.cell_size))
+        )
+        if bucket is None:
+            return []
+        found = [entry for entry in bucket.values() if entry[1].collidepoint(pos)]
+        return [entry[0] for entry in sorted(found, key=lambda e: e[2])]
@@ -5,8 +5,27 @@ if TYPE_CHECKING:
     from game import Game
 
 import json
+import math
+from collections import OrderedDict
+
 import pygame
 
+from scripts.grid import CHUNK_AREA, CHUNK_MASK, CHUNK_SHIFT, CHUNK_SIZE, ChunkGrid
+from scripts.mapfile import (
+    MAP_EXTENSION,
+    PAGED_EXTENSION,
+    PAGED_MAGIC,
+    MapData,
+    PagedMap,
+    decode_map,
+    is_binary_map,
+    is_paged_map,
+    read_map,
+    write_map,
+)
+from scripts.renderer import LAYER_TILES
+from scripts.spatial import SpatialHash
+
 NEIGHBOR_OFFSETS = [
     (-1, 0),
     (-1, -1),
@@ -19,6 +38,9 @@ NEIGHBOR_OFFSETS = [
     (1, 1),
 ]
 
+# Memory the resident chunks of a paged map may take up, see TileMap.open_paged
+STREAM_MEMORY_BUDGET = 64 * 1024 * 1024
+
 PHYSICS_TILES = {"grass", "stone"}
 AUTO_TILE_TYPES = {"grass", "stone"}
 AUTO_TILE_RULE_MAP = {
@@ -32,14 +54,148 @@ AUTO_TILE_RULE_MAP = {
     tuple(sorted([(1, 0), (0, -1), (0, 1)])): 7,
     tuple(sorted([(1, 0), (-1, 0), (0, 1), (0, -1)])): 8,
 }
+# The rules as a lookup table indexed by a 4-bit neighbor mask, one bit per side
+# with a tile of the same type. None means the variant is left as it is.
+AUTO_TILE_SIDES = [(1, 0), (-1, 0), (0, -1), (0, 1)]
+
+
+def neighbor_mask(neighbors):
+    return sum(
+        1 << bit for bit, shift in enumerate(AUTO_TILE_SIDES) if shift in neighbors
+    )
+
+
+AUTO_TILE_MASKS = {
+    neighbor_mask(neighbors): variant
+    for neighbors, variant in AUTO_TILE_RULE_MAP.items()
+}
+AUTO_TILE_VARIANTS = [AUTO_TILE_MASKS.get(mask) for mask in range(16)]
 
 
 class TileMap:
     def __init__(self, game: Game, tile_size=16):
         self.game = game
         self.tile_size = tile_size
-        self.tile_map = {}
+        # On-grid tiles live in an integer grid, the tile types are stored as ids
+        # into this palette and the "x;y" string keys only exist in the map files
+        self.grid = ChunkGrid()
+        self.tile_types = []
+        self.tile_type_ids = {}
+        self.physics_type_ids = set()
+        self.auto_tile_type_ids = set()
         self.off_grid_tiles = []
+        # Spatial index over the pixel bounds of the off-grid tiles, built on the
+        # first query so tiles extracted right after loading are never indexed
+        self.off_grid_index = None
+
+        # Collision cache: a pre-built rect per solid cell, and for every cell an
+        # entity has been in, the tuple of solid rects in its 3x3 neighborhood.
+        # The rects are shared between callers and must not be modified.
+        self.physics_rects = {}
+        self.physics_rects_cache = {}
+
+        # Render cache: on-grid tiles pre-composited into one surface per grid chunk.
+        # A missing entry means the chunk has to be (re)baked before it's drawn.
+        self.chunk_surfaces = {}
+
+        # Paging, for maps opened with open_paged: the file the chunks are read
+        # from, the chunks in the grid from least to most recently needed, how many
+        # of them fit in the memory budget and the table that translates the type
+        # ids of the file to the ones of this tile map
+        self.paged_map = None
+        self.resident_chunks = OrderedDict()
+        self.max_resident_chunks = 0
+        self.chunk_type_table = None
+
+    def type_id(self, tile_type):
+        if tile_type not in self.tile_type_ids:
+            self.tile_type_ids[tile_type] = len(self.tile_types)
+            self.tile_types.append(tile_type)
+            if tile_type in PHYSICS_TILES:
+                self.physics_type_ids.add(self.tile_type_ids[tile_type])
+            if tile_type in AUTO_TILE_TYPES:
+                self.auto_tile_type_ids.add(self.tile_type_ids[tile_type])
+        return self.tile_type_ids[tile_type]
+
+    def tile_at(self, tile_pos):
+        tile = self.grid.get(tile_pos[0], tile_pos[1])
+        if tile is None:
+            return None
+        return {
+            "type": self.tile_types[tile[0]],
+            "variant": tile[1],
+            "pos": [tile_pos[0], tile_pos[1]],
+        }
+
+    def set_tile(self, tile_pos, tile_type, variant):
+        self.grid.set(tile_pos[0], tile_pos[1], self.type_id(tile_type), variant)
+        self.invalidate_physics(tile_pos[0], tile_pos[1])
+        self.invalidate_chunk(tile_pos[0], tile_pos[1])
+
+    def remove_tile(self, tile_pos):
+        removed = self.grid.remove(tile_pos[0], tile_pos[1])
+        if removed:
+            self.invalidate_physics(tile_pos[0], tile_pos[1])
+            self.invalidate_chunk(tile_pos[0], tile_pos[1])
+        return removed
+
+    def tile_rect(self, x, y):
+        return pygame.Rect(
+            x * self.tile_size, y * self.tile_size, self.tile_size, self.tile_size
+        )
+
+    def build_physics_cache(self):
+        self.physics_rects = {}
+        self.physics_rects_cache = {}
+        for x, y, type_id, variant in self.grid.cells():
+            if type_id in self.physics_type_ids:
+                self.physics_rects[(x, y)] = self.tile_rect(x, y)
+
+    def invalidate_physics(self, x, y):
+        if self.grid.type_at(x, y) in self.physics_type_ids:
+            self.physics_rects[(x, y)] = self.tile_rect(x, y)
+        else:
+            self.physics_rects.pop((x, y), None)
+        for offset in NEIGHBOR_OFFSETS:
+            self.physics_rects_cache.pop((x - offset[0], y - offset[1]), None)
+
+    def off_grid_rect(self, tile):
+        # Rounded outwards, the tile can be drawn up to a pixel to either side of
+        # its position depending on how the camera offset truncates
+        img = self.game.assets[tile["type"]][tile["variant"]]
+        x = math.floor(tile["pos"][0])
+        y = math.floor(tile["pos"][1])
+        return pygame.Rect(
+            x,
+            y,
+            math.ceil(tile["pos"][0] + img.get_width()) - x,
+            math.ceil(tile["pos"][1] + img.get_height()) - y,
+        )
+
+    def build_off_grid_index(self):
+        self.off_grid_index = SpatialHash(cell_size=64)
+        for tile in self.off_grid_tiles:
+            self.off_grid_index.insert(tile, self.off_grid_rect(tile))
+
+    def add_off_grid_tile(self, tile):
+        self.off_grid_tiles.append(tile)
+        if self.off_grid_index is not None:
+            self.off_grid_index.insert(tile, self.off_grid_rect(tile))
+
+    def remove_off_grid_tile(self, tile):
+        self.off_grid_tiles.remove(tile)
+        if self.off_grid_index is not None:
+            self.off_grid_index.remove(tile)
+
+    def off_grid_tiles_at(self, pos):
+        if self.off_grid_index is None:
+            self.build_off_grid_index()
+        return self.off_grid_index.query_point(pos)
+
+    def off_grid_tiles_in(self, rect):
+        if self.off_grid_index is None:
+            self.build_off_grid_index()
+        return self.off_grid_index.query(rect)
 
     def extract(self, id_pairs, keep=False):
         matches = []
@@ -47,124 +203,396 @@ class TileMap:
             if (tile["type"], tile["variant"]) in id_pairs:
                 matches.append(tile.copy())
                 if not keep:
-                    self.off_grid_tiles.remove(tile)
-        for loc in self.tile_map:
-            tile = self.tile_map[loc]
-            if (tile["type"], tile["variant"]) in id_pairs:
-                matches.append(tile.copy())
-                # this line bellow is because we store the position of a tile as tile coordinates
-                # and we want the position in this method as pixel coordinates but we don't want to modify the original tile data
-                matches[-1]["pos"] = matches[-1]["pos"].copy()
-                matches[-1]["pos"][0] *= self.tile_size
-                matches[-1]["pos"][1] *= self.tile_size
+                    self.remove_off_grid_tile(tile)
+        # Listed up front, removing tiles can drop chunks from the grid
+        for x, y, type_id, variant in list(self.grid.cells()):
+            if (self.tile_types[type_id], variant) in id_pairs:
+                # On-grid tiles are stored in tile coordinates, but this method returns pixel coordinates
+                matches.append(
+                    {
+                        "type": self.tile_types[type_id],
+                        "variant": variant,
+                        "pos": [x * self.tile_size, y * self.tile_size],
+                    }
+                )
                 if not keep:
-                    del self.tile_map[loc]
+                    self.remove_tile((x, y))
         return matches
 
     def tiles_around(self, pos):
         tiles = []
         tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = (
-                str(tile_loc[0] + offset[0]) + ";" + str(tile_loc[1] + offset[1])
-            )
-            if check_loc in self.tile_map:
-                tiles.append(self.tile_map[check_loc])
+            tile = self.tile_at((tile_loc[0] + offset[0], tile_loc[1] + offset[1]))
+            if tile is not None:
+                tiles.append(tile)
         return tiles
 
     def solid_check(self, pos):
-        tile_loc = (
-            str(int(pos[0] // self.tile_size))
-            + ";"
-            + str(int(pos[1] // self.tile_size))
-        )
-        if tile_loc in self.tile_map:
-            if self.tile_map[tile_loc]["type"] in PHYSICS_TILES:
-                return self.tile_map[tile_loc]
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
+        if self.grid.type_at(tile_x, tile_y) in self.physics_type_ids:
+            return self.tile_at((tile_x, tile_y))
+        return None
+
+    def segment_hit(self, start, end):
+        # Walks the cells crossed by the segment in order (a grid DDA) and returns the
+        # point where it first enters a solid tile, so fast movers can't skip over walls
+        x = int(start[0] // self.tile_size)
+        y = int(start[1] // self.tile_size)
+        if self.grid.type_at(x, y) in self.physics_type_ids:
+            return (start[0], start[1])
+
+        end_x = int(end[0] // self.tile_size)
+        end_y = int(end[1] // self.tile_size)
+        dx = end[0] - start[0]
+        dy = end[1] - start[1]
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        # t is the fraction of the segment travelled when the next cell border is crossed
+        if dx:
+            t_max_x = ((x + (dx > 0)) * self.tile_size - start[0]) / dx
+            t_delta_x = self.tile_size / abs(dx)
+        else:
+            t_max_x = t_delta_x = math.inf
+        if dy:
+            t_max_y = ((y + (dy > 0)) * self.tile_size - start[1]) / dy
+            t_delta_y = self.tile_size / abs(dy)
+        else:
+            t_max_y = t_delta_y = math.inf
+
+        while x != end_x or y != end_y:
+            if t_max_x < t_max_y:
+                t = t_max_x
+                t_max_x += t_delta_x
+                x += step_x
+            else:
+                t = t_max_y
+                t_max_y += t_delta_y
+                y += step_y
+            if t > 1:
+                break
+            if self.grid.type_at(x, y) in self.physics_type_ids:
+                return (start[0] + dx * t, start[1] + dy * t)
         return None
 
+    def invalidate_chunk(self, x, y):
+        # Tiles bigger than a cell can spill into the chunks to the right and below
+        chunk_x = x >> CHUNK_SHIFT
+        chunk_y = y >> CHUNK_SHIFT
+        for shift in [(0, 0), (1, 0), (0, 1), (1, 1)]:
+            self.chunk_surfaces.pop((chunk_x + shift[0], chunk_y + shift[1]), None)
+
+    def bake_chunk(self, key):
+        tiles = []
+        for shift in [(-1, -1), (0, -1), (-1, 0), (0, 0)]:
+            tiles.extend(self.grid.chunk_cells((key[0] + shift[0], key[1] + shift[1])))
+        if not tiles:
+            return None
+
+        # Same draw order as drawing the tiles one by one: column by column
+        tiles.sort()
+        chunk_px = CHUNK_SIZE * self.tile_size
+        base_x = key[0] * chunk_px
+        base_y = key[1] * chunk_px
+        surf = pygame.Surface((chunk_px, chunk_px), pygame.SRCALPHA)
+        assets = self.game.assets
+        surf.fblits(
+            [
+                (
+                    assets[self.tile_types[type_id]][variant],
+                    (x * self.tile_size - base_x, y * self.tile_size - base_y),
+                )
+                for x, y, type_id, variant in tiles
+            ]
+        )
+        return surf
+
     def physics_rects_around(self, pos):
-        rects = []
-        for tile in self.tiles_around(pos):
-            if tile["type"] in PHYSICS_TILES:
-                rects.append(
-                    pygame.Rect(
-                        tile["pos"][0] * self.tile_size,
-                        tile["pos"][1] * self.tile_size,
-                        self.tile_size,
-                        self.tile_size,
-                    )
+        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        rects = self.physics_rects_cache.get(tile_loc)
+        if rects is None:
+            rects = []
+            for offset in NEIGHBOR_OFFSETS:
+                rect = self.physics_rects.get(
+                    (tile_loc[0] + offset[0], tile_loc[1] + offset[1])
                 )
+                if rect is not None:
+                    rects.append(rect)
+            rects = self.physics_rects_cache[tile_loc] = tuple(rects)
         return rects
 
     def auto_tile(self):
-        for loc in self.tile_map:
-            tile = self.tile_map[loc]
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = (
-                    str(tile["pos"][0] + shift[0])
-                    + ";"
-                    + str(tile["pos"][1] + shift[1])
-                )
-                if check_loc in self.tile_map:
-                    if self.tile_map[check_loc]["type"] == tile["type"]:
-                        neighbors.add(shift)
-            neighbors_tuple = tuple(sorted(neighbors))
-            if (tile["type"] in AUTO_TILE_TYPES) and (
-                neighbors_tuple in AUTO_TILE_RULE_MAP
-            ):
-                tile["variant"] = AUTO_TILE_RULE_MAP[neighbors_tuple]
+        # Whole-map pass (e.g. after an import), straight on the chunk arrays. Cells
+        # on the border of a chunk look their outside neighbors up in the grid.
+        auto_tile_type_ids = self.auto_tile_type_ids
+        type_at = self.grid.type_at
+        for key, chunk in self.grid.chunks.items():
+            types = chunk.types
+            variants = chunk.variants
+            base_x = key[0] << CHUNK_SHIFT
+            base_y = key[1] << CHUNK_SHIFT
+            for index in range(CHUNK_AREA):
+                type_id = types[index]
+                if type_id not in auto_tile_type_ids:
+                    continue
+                x = index & CHUNK_MASK
+                y = index >> CHUNK_SHIFT
+                mask = 0
+                if x < CHUNK_MASK:
+                    mask |= types[index + 1] == type_id
+                else:
+                    mask |= type_at(base_x + x + 1, base_y + y) == type_id
+                if x:
+                    mask |= (types[index - 1] == type_id) << 1
+                else:
+                    mask |= (type_at(base_x - 1, base_y + y) == type_id) << 1
+                if y:
+                    mask |= (types[index - CHUNK_SIZE] == type_id) << 2
+                else:
+                    mask |= (type_at(base_x + x, base_y - 1) == type_id) << 2
+                if y < CHUNK_MASK:
+                    mask |= (types[index + CHUNK_SIZE] == type_id) << 3
+                else:
+                    mask |= (type_at(base_x + x, base_y + y + 1) == type_id) << 3
+                variant = AUTO_TILE_VARIANTS[mask]
+                if variant is not None:
+                    variants[index] = variant
+        self.chunk_surfaces = {}
 
-    def render(self, surf: pygame.Surface, offset=(0, 0)):
-        for tile in self.off_grid_tiles:
-            surf.blit(
-                self.game.assets[tile["type"]][tile["variant"]],
+    def auto_tile_around(self, tile_pos):
+        # Incremental version for one edited cell: only the cell and its four
+        # neighbors can get another variant
+        self.auto_tile_cell(tile_pos[0], tile_pos[1])
+        for shift in AUTO_TILE_SIDES:
+            self.auto_tile_cell(tile_pos[0] + shift[0], tile_pos[1] + shift[1])
+
+    def auto_tile_cell(self, x, y):
+        tile = self.grid.get(x, y)
+        if tile is None or tile[0] not in self.auto_tile_type_ids:
+            return
+        type_at = self.grid.type_at
+        mask = 0
+        for bit, shift in enumerate(AUTO_TILE_SIDES):
+            if type_at(x + shift[0], y + shift[1]) == tile[0]:
+                mask |= 1 << bit
+        variant = AUTO_TILE_VARIANTS[mask]
+        if variant is not None and variant != tile[1]:
+            self.grid.set_variant(x, y, variant)
+            self.invalidate_chunk(x, y)
+
+    def blits(self, offset, size):
+        # The (img, pos) to draw for a view of 'size' at 'offset': the off-grid
+        # tiles in view, then the baked chunks on top of them
+        assets = self.game.assets
+        blits = [
+            (
+                assets[tile["type"]][tile["variant"]],
                 (tile["pos"][0] - offset[0], tile["pos"][1] - offset[1]),
             )
+            for tile in self.off_grid_tiles_in((offset[0], offset[1], size[0], size[1]))
+        ]
 
-        for x in range(
-            offset[0] // self.tile_size,
-            (offset[0] + surf.get_width()) // self.tile_size + 1,
+        chunk_px = CHUNK_SIZE * self.tile_size
+        for chunk_x in range(
+            offset[0] // chunk_px, (offset[0] + size[0]) // chunk_px + 1
         ):
-            for y in range(
-                offset[1] // self.tile_size,
-                (offset[1] + surf.get_height()) // self.tile_size + 1,
+            for chunk_y in range(
+                offset[1] // chunk_px, (offset[1] + size[1]) // chunk_px + 1
             ):
-                tile_key = str(x) + ";" + str(y)
-                if tile_key in self.tile_map:
-                    tile = self.tile_map[tile_key]
-                    surf.blit(
-                        self.game.assets[tile["type"]][tile["variant"]],
+                key = (chunk_x, chunk_y)
+                if key not in self.chunk_surfaces:
+                    self.chunk_surfaces[key] = self.bake_chunk(key)
+                chunk_surf = self.chunk_surfaces[key]
+                if chunk_surf is not None:
+                    blits.append(
                         (
-                            tile["pos"][0] * self.tile_size - offset[0],
-                            tile["pos"][1] * self.tile_size - offset[1],
-                        ),
+                            chunk_surf,
+                            (
+                                chunk_x * chunk_px - offset[0],
+                                chunk_y * chunk_px - offset[1],
+                            ),
+                        )
                     )
+        return blits
 
-        # for tile in self.tile_map.values():
-        #     surf.blit(
-        #         self.game.assets[tile["type"]][tile["variant"]],
-        #         (
-        #             tile["pos"][0] * self.tile_size - offset[0],
-        #             tile["pos"][1] * self.tile_size - offset[1],
-        #         ),
-        #     )
+    def render(self, surf: pygame.Surface, offset=(0, 0)):
+        surf.fblits(self.blits(offset, surf.get_size()))
+
+    def submit(self, queue, offset=(0, 0)):
+        queue.extend(self.blits(offset, queue.size), LAYER_TILES)
+
+    def to_map_data(self):
+        # Only the resident chunks of a streamed map are in the grid, writing them
+        # out would lose the rest of the map
+        if self.paged_map is not None:
+            raise ValueError(
+                "Can't save a streamed paged map, load it with stream=False to edit it"
+            )
+        # The palette also has to name the off-grid tile types
+        for tile in self.off_grid_tiles:
+            self.type_id(tile["type"])
+        map_data = MapData(self.tile_size)
+        map_data.types = list(self.tile_types)
+        for x, y, type_id, variant in self.grid.cells():
+            map_data.xs.append(x)
+            map_data.ys.append(y)
+            map_data.type_ids.append(type_id)
+            map_data.variants.append(variant)
+        map_data.off_grid = self.off_grid_tiles
+        return map_data
 
     def save(self, filename):
+        # Files ending in MAP_EXTENSION or PAGED_EXTENSION get the binary formats,
+        # see scripts/mapfile.py
+        map_data = self.to_map_data()
+        if str(filename).endswith((MAP_EXTENSION, PAGED_EXTENSION)):
+            write_map(filename, map_data)
+            return
+
+        # The grid is converted back to the "x;y" keyed format used by the map files
+        tile_map = {}
+        for x, y, type_id, variant in self.grid.cells():
+            tile_map[str(x) + ";" + str(y)] = {
+                "type": self.tile_types[type_id],
+                "variant": variant,
+                "pos": [x, y],
+            }
         with open(filename, "w") as f:
             json.dump(
                 {
-                    "tilemap": self.tile_map,
+                    "tilemap": tile_map,
                     "tile_size": self.tile_size,
                     "offgrid": self.off_grid_tiles,
                 },
                 f,
             )
 
-    def load(self, filename):
-        with open(filename, "r") as f:
-            data = json.load(f)
-            self.tile_map = data["tilemap"]
-            self.tile_size = data["tile_size"]
-            self.off_grid_tiles = data["offgrid"]
+    def load(self, filename, stream=True):
+        # Any format, binary maps start with a magic number. The chunks of paged
+        # maps are loaded by stream() as they're needed, unless 'stream' is False
+        # (e.g. to edit the map) and the whole map is read.
+        with open(filename, "rb") as f:
+            raw = f.read(len(PAGED_MAGIC))
+            if is_paged_map(raw):
+                if stream:
+                    self.open_paged(filename)
+                else:
+                    self.load_map_data(read_map(filename))
+                return
+            raw += f.read()
+        self.close_paged()
+        if is_binary_map(raw):
+            self.load_map_data(decode_map(raw))
+            return
+
+        data = json.loads(raw)
+        self.tile_size = data["tile_size"]
+        self.off_grid_tiles = data["offgrid"]
+        self.off_grid_index = None
+        self.grid.clear()
+        for tile in data["tilemap"].values():
+            self.grid.set(
+                tile["pos"][0],
+                tile["pos"][1],
+                self.type_id(tile["type"]),
+                tile["variant"],
+            )
+        self.build_physics_cache()
+        self.chunk_surfaces = {}
+
+    def load_map_data(self, map_data):
+        self.close_paged()
+        self.tile_size = map_data.tile_size
+        self.off_grid_tiles = map_data.off_grid
+        self.off_grid_index = None
+        self.grid.clear()
+        # The map's palette ids to the ones of this tile map
+        type_ids = [self.type_id(tile_type) for tile_type in map_data.types]
+        grid_set = self.grid.set
+        for x, y, type_id, variant in zip(
+            map_data.xs, map_data.ys, map_data.type_ids, map_data.variants
+        ):
+            grid_set(x, y, type_ids[type_id], variant)
+        self.build_physics_cache()
+        self.chunk_surfaces = {}
+
+    def open_paged(self, filename, memory_budget=STREAM_MEMORY_BUDGET):
+        # Opens a chunk-paged map (see scripts/mapfile.py). Only its off-grid tiles
+        # are loaded, the on-grid chunks are loaded and evicted by stream().
+        self.close_paged()
+        paged_map = PagedMap(filename)
+        self.tile_size = paged_map.tile_size
+        self.off_grid_tiles = paged_map.off_grid
+        self.off_grid_index = None
+        self.grid.clear()
+        self.physics_rects = {}
+        self.physics_rects_cache = {}
+        self.chunk_surfaces = {}
+        table = bytearray(range(256))
+        for i, tile_type in enumerate(paged_map.types):
+            table[i] = self.type_id(tile_type)
+        self.chunk_type_table = bytes(table)
+        # A resident chunk costs its cell arrays and, once drawn, its baked surface
+        chunk_px = CHUNK_SIZE * self.tile_size
+        chunk_bytes = CHUNK_AREA * 2 + chunk_px * chunk_px * 4
+        self.max_resident_chunks = max(1, memory_budget // chunk_bytes)
+        self.paged_map = paged_map
+
+    def close_paged(self):
+        if self.paged_map is not None:
+            self.paged_map.close()
+            self.paged_map = None
+            self.resident_chunks.clear()
+
+    def stream(self, areas):
+        # Makes the chunks of a paged map resident around 'areas', pixel rects as
+        # (x, y, w, h) such as the view and the entities, with one chunk of margin
+        # so everything they can touch before the next call is there. The least
+        # recently needed chunks are evicted once there are more than the budget.
+        if self.paged_map is None:
+            return
+        chunk_px = CHUNK_SIZE * self.tile_size
+        needed = []
+        for x, y, w, h in areas:
+            for chunk_x in range(int(x // chunk_px) - 1, int((x + w) // chunk_px) + 2):
+                for chunk_y in range(
+                    int(y // chunk_px) - 1, int((y + h) // chunk_px) + 2
+                ):
+                    needed.append((chunk_x, chunk_y))
+
+        resident = self.resident_chunks
+        for key in needed:
+            if key in resident:
+                resident.move_to_end(key)
+            elif key in self.paged_map:
+                self.page_in(key)
+        # The needed chunks are all at the end, so only older ones are evicted
+        needed = set(needed)
+        while len(resident) > self.max_resident_chunks:
+            key = next(iter(resident))
+            if key in needed:
+                break
+            self.page_out(key)
+
+    def page_in(self, key):
+        types, variants = self.paged_map.chunk(key)
+        self.grid.load_chunk(key, types.translate(self.chunk_type_table), variants)
+        self.resident_chunks[key] = True
+        for x, y, type_id, variant in self.grid.chunk_cells(key):
+            if type_id in self.physics_type_ids:
+                self.physics_rects[(x, y)] = self.tile_rect(x, y)
+        self.chunk_changed(key)
+
+    def page_out(self, key):
+        for x, y, type_id, variant in self.grid.chunk_cells(key):
+            self.physics_rects.pop((x, y), None)
+        self.grid.unload_chunk(key)
+        del self.resident_chunks[key]
+        self.chunk_changed(key)
+
+    def chunk_changed(self, key):
+        # The neighborhoods next to the chunk and the baked surfaces it's drawn on
+        # are out of date
+        self.physics_rects_cache.clear()
+        self.invalidate_chunk(key[0] << CHUNK_SHIFT, key[1] << CHUNK_SHIFT)
@@ -1,4 +1,5 @@
 import os
+from collections import OrderedDict
 from pathlib import Path
 
 import pygame
@@ -19,16 +20,68 @@ def load_images(path: str):
     return images
 
 
+class SilentSound:
+    # Stand-in for pygame.mixer.Sound when there's no audio device
+    def play(self, *args, **kwargs):
+        pass
+
+    def stop(self):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+
+class TransformCache:
+    def __init__(self, max_entries=256):
+        # Transformed copies of surfaces (flipped, scaled or tinted), made once and
+        # kept for the 'max_entries' most recently used variants
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+    def get(self, img, flip_x=False, flip_y=False, size=None, tint=None):
+        key = (img, flip_x, flip_y, size, tint)
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            return result
+
+        result = img
+        if flip_x or flip_y:
+            result = pygame.transform.flip(result, flip_x, flip_y)
+        if size is not None and size != result.get_size():
+            result = pygame.transform.scale(result, size)
+        if tint is not None:
+            result = result.copy()
+            result.fill(tint, special_flags=pygame.BLEND_RGB_MULT)
+        self.entries[key] = result
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return result
+
+
 class Animation:
-    def __init__(self, images, img_dur=5, loop=True):
+    __slots__ = ("images", "flipped", "img_duration", "loop", "done", "frame")
+
+    def __init__(self, images, img_dur=5, loop=True, flipped=None):
         self.images = images
+        # The frames mirrored horizontally, made once and shared by every copy
+        if flipped is None:
+            flipped = [pygame.transform.flip(img, True, False) for img in images]
+        self.flipped = flipped
         self.img_duration = img_dur
         self.loop = loop
         self.done = False
         self.frame = 0
 
     def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
+        return Animation(self.images, self.img_duration, self.loop, self.flipped)
 
     def update(self):
         if self.loop:
@@ -39,5 +92,6 @@ class Animation:
         if self.frame >= len(self.images) * self.img_duration - 1:
             self.done = True
 
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)]
+    def img(self, flip=False):
+        images = self.flipped if flip else self.images
+        return images[int(self.frame / self.img_duration)]